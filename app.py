@@ -1,19 +1,59 @@
 import os
+import atexit
 import logging
 import base64
+import io
+import queue
+import struct
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
-from flask import Flask, render_template, request, jsonify
-from face_analyzer import FaceShapeAnalyzer
-from feather_integration import TelegramBotAPI
+from flask import Flask, render_template, request, jsonify, send_file
 
 # Configure Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "default_secret_key")
 
-# Initialize face analyzer and Telegram Bot API client
-face_analyzer = FaceShapeAnalyzer()
-telegram_bot = TelegramBotAPI()
+# Decodes batch uploads in the background while earlier images are being analyzed
+_decode_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='decode')
+
+# MediaPipe FaceMesh is not thread-safe, so each request checks out an analyzer of its own.
+# Idle analyzers are reused, so a worker never holds more of them than its peak concurrency.
+_idle_analyzers = queue.LifoQueue()
+_all_analyzers = []
+_all_analyzers_lock = threading.Lock()
+
+# Heavy modules (mediapipe, Telegram client) are imported on first use so that
+# workers start quickly and /ping answers right away.
+@contextmanager
+def _checkout_analyzer():
+    """Borrow an idle face analyzer for the duration of the block, creating one if needed."""
+    try:
+        analyzer = _idle_analyzers.get_nowait()
+    except queue.Empty:
+        from face_analyzer import FaceShapeAnalyzer
+        analyzer = FaceShapeAnalyzer()
+        with _all_analyzers_lock:
+            _all_analyzers.append(analyzer)
+    try:
+        yield analyzer
+    finally:
+        _idle_analyzers.put(analyzer)
+
+@atexit.register
+def _close_analyzers():
+    """Release the MediaPipe graphs of all analyzers when the worker exits."""
+    with _all_analyzers_lock:
+        for analyzer in _all_analyzers:
+            analyzer.close()
+        _all_analyzers.clear()
+
+def get_telegram_bot():
+    """Return the shared Telegram Bot API client."""
+    from feather_integration import telegram_api
+    return telegram_api
 
 @app.route('/')
 def index():
@@ -25,60 +65,178 @@ def ping():
     """Simple endpoint to check if the application is running."""
     return jsonify({"status": "ok", "message": "Service is running"}), 200
 
+# FaceMesh works on downscaled frames, so large uploads are decoded at reduced size
+MAX_DECODE_SIDE = 1600
+MIN_DECODE_SIDE = 512
+
+# JPEG SOFn markers carry the frame size (C4, C8 and CC are DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _image_size(data):
+    """Read (width, height) from a JPEG or PNG header without decoding pixels; None if unknown."""
+    if data[:8] == b'\x89PNG\r\n\x1a\n' and data[12:16] == b'IHDR':
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+    if data[:2] != b'\xff\xd8':
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            # Standalone markers have no length field
+            pos += 2
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if pos + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + length
+    return None
+
+def _decode_flag(size):
+    """Pick the imdecode flag so that the decoded long side lands near MIN..MAX_DECODE_SIDE."""
+    if size is None:
+        return cv2.IMREAD_COLOR
+    long_side = max(size)
+    if long_side > 2 * MAX_DECODE_SIDE:
+        # Very large photo (e.g. from a phone camera) - decode at 1/4 size
+        return cv2.IMREAD_REDUCED_COLOR_4
+    if long_side < 2 * MIN_DECODE_SIDE:
+        # Small image (e.g. a webcam frame) - keep the full resolution for accurate landmarks
+        return cv2.IMREAD_COLOR
+    return cv2.IMREAD_REDUCED_COLOR_2
+
+def _decode_image(data):
+    """Decode a compressed image once, letting libjpeg downscale large photos during decoding."""
+    flag = _decode_flag(_image_size(data))
+    return cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+
+def _has_image():
+    """Check whether the current request carries an image."""
+    return 'image' in request.files or 'image_data' in request.form
+
+def _read_image():
+    """Decode the image uploaded with the current request."""
+    if 'image' not in request.files:
+        # Handle base64 encoded image, skipping the "data:image/...;base64," prefix without copying
+        data = request.form['image_data'].encode('ascii')
+        comma = data.find(b',')
+        image_data = base64.b64decode(memoryview(data)[comma + 1:])
+        return _decode_image(image_data)
+    
+    # Handle regular file upload
+    file = request.files['image']
+    return _decode_image(file.stream.read())
+
+def _send_to_telegram(result, chat_id):
+    """Send a successful analysis result to a Telegram chat and record the delivery status."""
+    telegram_bot = get_telegram_bot()
+    if not telegram_bot.is_configured():
+        return
+    
+    # Отправляем результаты анализа в Telegram (рекомендации по стилю отправляются вместе с ними)
+    telegram_response = telegram_bot.send_analysis_result(
+        chat_id=chat_id,
+        face_shape=result['face_shape'],
+        description=result['description'],
+        confidence=result['confidence'],
+        image_data=result['image_with_landmarks']
+    )
+    
+    # Добавляем информацию об отправке в результат (Telegram Bot API сообщает об успехе полем "ok")
+    result['telegram_message_sent'] = telegram_response.get('ok', False)
+    result['telegram_recommendations_sent'] = telegram_response.get('recommendations_sent', False)
+
+def _analyze_image(image, chat_id=None):
+    """Analyze a decoded image and, if a chat ID is given, send the results to Telegram."""
+    with _checkout_analyzer() as analyzer:
+        result = analyzer.analyze(image)
+    
+    if result['success'] and chat_id is not None:
+        _send_to_telegram(result, chat_id)
+    return result
+
+def analyze_bytes(img_bytes, chat_id=None):
+    """
+    Analyze a compressed image (JPEG/PNG bytes) in-process.
+    
+    This is the body of the /analyze endpoint without the HTTP layer, so that
+    the Telegram bot can call it directly when it runs on the same host.
+    Returns the same result dictionary as /analyze.
+    """
+    image = _decode_image(img_bytes)
+    return _analyze_image(image, chat_id)
+
 @app.route('/analyze', methods=['POST'])
 def analyze_face():
     """Analyze the uploaded face image and return the results."""
     try:
         # Get the image from the request
-        if 'image' not in request.files:
-            if 'image_data' not in request.form:
-                return jsonify({'error': 'No image provided'}), 400
-            
-            # Handle base64 encoded image
-            image_b64 = request.form['image_data'].split(',')[1]
-            image_data = base64.b64decode(image_b64)
-            nparr = np.frombuffer(image_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        else:
-            # Handle regular file upload
-            file = request.files['image']
-            nparr = np.frombuffer(file.read(), np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        if not _has_image():
+            return jsonify({'error': 'No image provided'}), 400
+        image = _read_image()
         
-        # Analyze the face
-        result = face_analyzer.analyze(image)
+        # Analyze the face and send the results to Telegram if a chat ID was provided
+        result = _analyze_image(image, request.form.get('telegram_chat_id'))
         
         if not result['success']:
             return jsonify({'error': result['message']}), 400
         
-        # Добавляем возможность отправки результатов через Telegram
-        if telegram_bot.is_configured() and 'telegram_chat_id' in request.form:
-            # Получаем ID чата из запроса
-            chat_id = request.form['telegram_chat_id']
-            
-            # Отправляем результаты анализа в Telegram
-            telegram_response = telegram_bot.send_analysis_result(
-                chat_id=chat_id,
-                face_shape=result['face_shape'],
-                description=result['description'],
-                confidence=result['confidence'],
-                image_data=result['image_with_landmarks']
-            )
-            
-            # Добавляем информацию об отправке в результат
-            result['telegram_message_sent'] = telegram_response.get('success', False)
-            
-            # Отправляем рекомендации по стилю
-            recommendations_response = telegram_bot.send_recommendations(
-                chat_id=chat_id,
-                face_shape=result['face_shape']
-            )
-            
-            # Добавляем информацию об отправке рекомендаций в результат
-            result['telegram_recommendations_sent'] = recommendations_response.get('success', False)
-        
         return jsonify(result)
     
     except Exception as e:
         logging.error(f"Error analyzing face: {str(e)}")
         return jsonify({'error': f'Error processing image: {str(e)}'}), 500
+
+@app.route('/analyze_raw', methods=['POST'])
+def analyze_face_raw():
+    """Analyze the uploaded face image and return the annotated JPEG directly."""
+    try:
+        if not _has_image():
+            return jsonify({'error': 'No image provided'}), 400
+        image = _read_image()
+        
+        with _checkout_analyzer() as analyzer:
+            result = analyzer.analyze(image, as_data_url=False)
+        
+        if not result['success']:
+            return jsonify({'error': result['message']}), 400
+        
+        response = send_file(io.BytesIO(result['image_jpeg']), mimetype='image/jpeg')
+        response.headers['X-Face-Shape'] = result['face_shape']
+        response.headers['X-Face-Confidence'] = f"{result['confidence']:.4f}"
+        return response
+    
+    except Exception as e:
+        logging.error(f"Error analyzing face: {str(e)}")
+        return jsonify({'error': f'Error processing image: {str(e)}'}), 500
+
+@app.route('/analyze_batch', methods=['POST'])
+def analyze_face_batch():
+    """Analyze several uploaded face images in one request and return a list of results."""
+    try:
+        files = request.files.getlist('images')
+        if not files:
+            return jsonify({'error': 'No images provided'}), 400
+        
+        include_visualization = request.form.get('include_visualization', 'true').lower() != 'false'
+        buffers = [file.stream.read() for file in files]
+        results = []
+        with _checkout_analyzer() as analyzer:
+            for image in _decode_pool.map(_decode_image, buffers):
+                result = analyzer.analyze(image, include_visualization=include_visualization)
+                results.append(result)
+        
+        return jsonify({'results': results})
+    
+    except Exception as e:
+        logging.error(f"Error analyzing faces: {str(e)}")
+        return jsonify({'error': f'Error processing images: {str(e)}'}), 500
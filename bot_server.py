@@ -6,8 +6,7 @@ import sys
 import time
 import logging
 import threading
-import requests
-from telegram_bot import polling_loop, set_webhook
+from telegram_bot import EXECUTOR, SESSION, polling_loop, set_webhook
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,6 +15,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Таймаут long polling: Telegram держит запрос открытым до появления обновлений
+POLL_TIMEOUT = 50
+
 def run_polling():
     """Запускает режим long polling для бота."""
     logger.info("Запуск бота в режиме long polling...")
@@ -25,10 +27,10 @@ def run_polling():
     API_URL = f"https://api.telegram.org/bot{TOKEN}"
     
     try:
-        webhook_info = requests.get(f"{API_URL}/getWebhookInfo", timeout=10).json()
+        webhook_info = SESSION.get(f"{API_URL}/getWebhookInfo", timeout=10).json()
         if webhook_info.get("ok") and webhook_info["result"].get("url"):
             logger.info(f"Отключение вебхука: {webhook_info['result']['url']}")
-            delete_result = requests.get(f"{API_URL}/deleteWebhook", timeout=10).json()
+            delete_result = SESSION.get(f"{API_URL}/deleteWebhook", timeout=10).json()
             if delete_result.get("ok"):
                 logger.info("Вебхук успешно отключен")
             else:
@@ -38,11 +40,13 @@ def run_polling():
     
     # Запускаем бота в режиме long polling
     try:
-        polling_loop()
+        polling_loop(poll_timeout=POLL_TIMEOUT)
     except KeyboardInterrupt:
         logger.info("Бот остановлен вручную")
     except Exception as e:
         logger.error(f"Критическая ошибка в работе бота: {str(e)}")
+    finally:
+        EXECUTOR.shutdown(wait=True)
         
     logger.info("Бот остановлен")
 
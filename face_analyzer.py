@@ -6,13 +6,27 @@ import numpy as np
 import mediapipe as mp
 import base64
 import logging
-from typing import Dict, Any, Tuple, List, Optional
+from typing import Dict, Any, Tuple, Optional
+
+def _above(value: float) -> float:
+    """Smallest float strictly greater than value (turns "x > value" into "x >= bound")."""
+    return float(np.nextafter(value, np.inf))
+
+def _below(value: float) -> float:
+    """Largest float strictly less than value (turns "x < value" into "x <= bound")."""
+    return float(np.nextafter(value, -np.inf))
 
 class FaceShapeAnalyzer:
     """Class for analyzing face shapes using MediaPipe and OpenCV."""
     
-    def __init__(self):
-        """Initialize the face mesh detector from MediaPipe."""
+    def __init__(self, refine_landmarks: bool = False):
+        """
+        Initialize the face mesh detector from MediaPipe.
+        
+        Args:
+            refine_landmarks: Load the attention submodel for iris and lips.
+                The analyzer itself does not use the refined points.
+        """
         self.mp_face_mesh = mp.solutions.face_mesh
         self.mp_drawing = mp.solutions.drawing_utils
         self.mp_drawing_styles = mp.solutions.drawing_styles
@@ -21,10 +35,36 @@ class FaceShapeAnalyzer:
         self.face_mesh = self.mp_face_mesh.FaceMesh(
             static_image_mode=True,
             max_num_faces=1,
-            refine_landmarks=True,
+            refine_landmarks=refine_landmarks,
             min_detection_confidence=0.5
         )
         
+        # Буфер для RGB-кадра: анализатор используется одним потоком за раз (см. пул в app.py)
+        self._rgb_buf = None
+        
+        # Параметры кодирования изображения с разметкой
+        self.JPEG_ENCODE_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        
+        # Максимальный размер длинной стороны изображения с разметкой
+        self.MAX_VISUALIZATION_SIDE = 720
+        
+        # Стиль контура лица на изображении - компактный и читаемый для Telegram
+        self._connection_style = self.mp_drawing_styles.get_default_face_mesh_tesselation_style()
+        self._connection_style.color = (0, 180, 255)  # Оранжевый цвет для соединений
+        self._connection_style.thickness = 1  # Тонкие линии для соединений
+        
+        # Маркер ключевой точки рисуется один раз: черная обводка и зеленая точка внутри.
+        # Храним смещения его пикселей от центра и их цвета, чтобы ставить все маркеры сразу.
+        marker = np.zeros((15, 15, 3), dtype=np.uint8)
+        marker_mask = np.zeros((15, 15), dtype=np.uint8)
+        cv2.circle(marker, (7, 7), 5, (0, 0, 0), 2)
+        cv2.circle(marker_mask, (7, 7), 5, 255, 2)
+        cv2.circle(marker, (7, 7), 3, (0, 255, 0), -1)
+        cv2.circle(marker_mask, (7, 7), 3, 255, -1)
+        ys, xs = np.nonzero(marker_mask)
+        self._marker_offsets = np.stack([xs - 7, ys - 7], axis=1)
+        self._marker_colors = marker[ys, xs]
+        
         # Ключевые индексы для определения формы лица
         # Эти индексы соответствуют точкам лица в MediaPipe FaceMesh
         self.FACE_OVAL_INDICES = [
@@ -49,6 +89,23 @@ class FaceShapeAnalyzer:
             296  # Левый край лба
         ]
         
+        # Все ключевые точки одним массивом индексов для векторной выборки
+        self._key_idx = np.array(
+            self.FACE_OVAL_INDICES + self.CHEEKBONE_INDICES + self.JAW_INDICES + self.FOREHEAD_INDICES,
+            dtype=np.int32
+        )
+        
+        # Отрезки для измерений: от точек (или середин пар точек) idx_a к точкам idx_b.
+        # Порядок: лоб, скулы, челюсть, высота лица, нижняя часть лица, подбородок-челюсть.
+        chin = self.FACE_OVAL_INDICES[0]
+        self._measure_idx_a = np.array([self.FOREHEAD_INDICES[0], self.CHEEKBONE_INDICES[0],
+                                        self.JAW_INDICES[0], self.FACE_OVAL_INDICES[2]], dtype=np.int32)
+        self._measure_mid_idx = np.array([self.CHEEKBONE_INDICES, self.JAW_INDICES], dtype=np.int32)
+        self._measure_idx_b = np.array([self.FOREHEAD_INDICES[1], self.CHEEKBONE_INDICES[1],
+                                        self.JAW_INDICES[1], chin, chin, chin], dtype=np.int32)
+        self._measure_keys = ("forehead_width", "cheekbone_width", "jaw_width", "face_height",
+                              "lower_face_height", "chin_to_jaw_length")
+        
         self.FACE_SHAPE_DESCRIPTIONS = {
             "oval": """
                 У вас овальная форма лица, которая считается идеальной и наиболее универсальной в мире стиля. 
@@ -107,13 +164,121 @@ class FaceShapeAnalyzer:
                 Эта форма лица подчеркивает сильный характер и выразительный профиль.
             """
         }
+        
+        # Формы лица в порядке приоритета при равенстве очков:
+        # oval > heart > diamond > round > square > oblong > triangle
+        self._shapes = ["oval", "heart", "diamond", "round", "square", "oblong", "triangle"]
+        
+        # Признаки для определения формы лица: все сравнения сведены к отношениям
+        self._feature_names = [
+            "face_width_to_height_ratio",    # скулы / высота лица
+            "forehead_to_jaw_ratio",         # лоб / челюсть
+            "cheekbone_to_jaw_ratio",        # скулы / челюсть
+            "cheekbone_to_widest_ratio",     # скулы / max(лоб, челюсть)
+            "forehead_to_cheekbone_ratio",   # лоб / скулы
+            "jaw_to_forehead_ratio",         # челюсть / лоб
+            "jaw_to_cheekbone_ratio",        # челюсть / скулы
+            "chin_to_lower_face_ratio",      # подбородок-челюсть / нижняя часть лица
+        ]
+        
+        # Правила начисления очков: (форма, очки, {признак: (нижняя граница, верхняя граница)}).
+        # Границы включительные; правило срабатывает, если выполнены все его условия.
+        inf = np.inf
+        rules = [
+            # Овальная форма лица
+            # - Сбалансированные пропорции
+            # - Соотношение ширины к высоте около 2/3
+            # - Мягкая линия подбородка
+            # - Нет выраженных "углов" или чрезмерных пропорций
+            ("oval", 2, {"face_width_to_height_ratio": (0.63, 0.77)}),
+            ("oval", 1, {"forehead_to_jaw_ratio": (0.87, 1.13)}),
+            ("oval", 1, {"cheekbone_to_jaw_ratio": (0.9, 1.15)}),
+            
+            # Круглая форма лица
+            # - Примерно одинаковая ширина и высота
+            # - Скулы - самая широкая часть лица
+            # - Мягкая линия подбородка без выраженных углов
+            ("round", 2, {"cheekbone_to_widest_ratio": (_above(1.05), inf)}),
+            ("round", 1, {"chin_to_lower_face_ratio": (-inf, _below(0.35))}),
+            
+            # Квадратная форма лица
+            # - Ширина лба, скул и челюсти примерно одинаковая
+            # - Выраженная линия челюсти с четкими углами
+            ("square", 3, {"forehead_to_jaw_ratio": (0.9, 1.1),
+                           "cheekbone_to_jaw_ratio": (0.9, 1.1)}),
+            ("square", 2, {"chin_to_lower_face_ratio": (-inf, _below(0.28))}),
+            
+            # Сердцевидная форма лица
+            # - Широкий лоб и узкий подбородок
+            # - Сужение лица к подбородку
+            ("heart", 2, {"forehead_to_cheekbone_ratio": (_above(1.05), inf)}),
+            ("heart", 1, {"chin_to_lower_face_ratio": (_above(0.38), inf)}),
+            
+            # Ромбовидная форма лица
+            # - Скулы - самая широкая часть лица
+            # - Лоб и подбородок уже чем скулы
+            ("diamond", 2, {"cheekbone_to_widest_ratio": (_above(1.0), inf)}),
+            
+            # Продолговатая форма лица
+            # - Длинное лицо с примерно одинаковой шириной лба, скул и челюсти
+            # - Соотношение высоты к ширине больше чем у овального
+            ("oblong", 2, {"forehead_to_jaw_ratio": (0.85, 1.15),
+                           "cheekbone_to_jaw_ratio": (0.85, 1.15)}),
+            
+            # Треугольная форма лица (основание вниз)
+            # - Узкий лоб и широкая челюсть
+            # - Обратная форма сердца
+            ("triangle", 2, {"jaw_to_cheekbone_ratio": (_above(1.05), inf)}),
+        ]
+        
+        # Ступенчатые правила ("если > A: +3, иначе если > B: +1"):
+        # (форма, признак, пороги, очки для каждой ступени, side для np.searchsorted).
+        # side="right" - нестрогие сравнения (>=, <), side="left" - строгие (>, <=).
+        staircases = [
+            ("round", "face_width_to_height_ratio", [0.73, 0.78], [0, 1, 3], "right"),
+            ("heart", "forehead_to_jaw_ratio", [1.08, 1.15], [0, 1, 3], "left"),
+            ("diamond", "cheekbone_to_widest_ratio", [1.05, 1.13], [0, 1, 3], "left"),
+            ("oblong", "face_width_to_height_ratio", [0.62, 0.67], [3, 1, 0], "right"),
+            ("triangle", "jaw_to_forehead_ratio", [1.05, 1.15], [0, 1, 3], "left"),
+        ]
+        self._staircases = [
+            (self._shapes.index(shape), self._feature_names.index(feature),
+             np.array(thresholds), np.array(points), side)
+            for shape, feature, thresholds, points, side in staircases
+        ]
+        
+        # Матрицы границ (правило x признак) и весов (правило x форма)
+        self._low = np.full((len(rules), len(self._feature_names)), -inf)
+        self._high = np.full((len(rules), len(self._feature_names)), inf)
+        self._weights = np.zeros((len(rules), len(self._shapes)), dtype=np.int64)
+        for row, (shape, points, bounds) in enumerate(rules):
+            self._weights[row, self._shapes.index(shape)] = points
+            for feature, (low, high) in bounds.items():
+                col = self._feature_names.index(feature)
+                self._low[row, col] = low
+                self._high[row, col] = high
+    
+    def close(self) -> None:
+        """Release the MediaPipe FaceMesh graph and its TFLite resources."""
+        self.face_mesh.close()
+    
+    def __enter__(self) -> "FaceShapeAnalyzer":
+        return self
     
-    def analyze(self, image: np.ndarray) -> Dict[str, Any]:
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+    
+    def analyze(self, image: np.ndarray, as_data_url: bool = True,
+                include_visualization: bool = True) -> Dict[str, Any]:
         """
         Analyze the face in the provided image.
         
         Args:
             image: The input image as a numpy array (BGR format from OpenCV)
+            as_data_url: Return the visualization as a base64 data URL in
+                "image_with_landmarks"; otherwise raw JPEG bytes in "image_jpeg"
+            include_visualization: Draw and encode the annotated image; when False
+                only the shape, confidence, description and measurements are returned
             
         Returns:
             A dictionary containing analysis results
@@ -125,12 +290,14 @@ class FaceShapeAnalyzer:
                 "message": "Предоставлено пустое изображение"
             }
         
-        # Преобразуем BGR в RGB для MediaPipe
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        # Преобразуем BGR в RGB для MediaPipe, переиспользуя буфер анализатора
+        if self._rgb_buf is None or self._rgb_buf.shape != image.shape:
+            self._rgb_buf = np.empty_like(image)
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._rgb_buf)
         height, width, _ = image.shape
         
         # Обрабатываем изображение с помощью Face Mesh
-        results = self.face_mesh.process(image_rgb)
+        results = self.face_mesh.process(np.ascontiguousarray(image_rgb))
         
         # Проверяем, обнаружено ли лицо
         if not results.multi_face_landmarks:
@@ -141,92 +308,101 @@ class FaceShapeAnalyzer:
         
         # Получаем первое (и, предположительно, единственное) лицо
         face_landmarks = results.multi_face_landmarks[0]
-        landmarks = [(lm.x * width, lm.y * height) for lm in face_landmarks.landmark]
+        # Координаты всех точек одним массивом (N, 2) в пикселях
+        landmarks = np.array([(lm.x, lm.y) for lm in face_landmarks.landmark], dtype=np.float32)
+        landmarks *= (width, height)
+        
+        # Получаем измерения лица
+        measurements = self._measure_face(landmarks)
+        
+        # Определяем форму лица
+        face_shape, confidence = self._determine_face_shape(measurements)
+        
+        # Создаем словарь с результатами анализа
+        result = {
+            "success": True,
+            "face_shape": face_shape,
+            "confidence": confidence,
+            "description": self.FACE_SHAPE_DESCRIPTIONS[face_shape].strip(),
+            "measurements": measurements
+        }
+        
+        if not include_visualization:
+            return result
         
-        # Создаем копию изображения для отображения точек и измерений
-        visualization_image = image.copy()
+        visualization_image = self._draw_visualization(
+            image, face_landmarks, landmarks, measurements, face_shape, confidence
+        )
+        _, buffer = cv2.imencode('.jpg', visualization_image, self.JPEG_ENCODE_PARAMS)
+        
+        if as_data_url:
+            # Преобразуем изображение с разметкой в base64 для отправки в веб-интерфейс
+            img_base64 = base64.b64encode(buffer).decode('utf-8')
+            result["image_with_landmarks"] = f"data:image/jpeg;base64,{img_base64}"
+        else:
+            result["image_jpeg"] = buffer.tobytes()
         
-        # Настраиваем стиль отображения на более компактный и читаемый для Telegram
-        connection_style = self.mp_drawing_styles.get_default_face_mesh_tesselation_style()
-        connection_style.color = (0, 180, 255)  # Оранжевый цвет для соединений 
-        connection_style.thickness = 1  # Тонкие линии для соединений
+        return result
+    
+    def _draw_visualization(self, image: np.ndarray, face_landmarks: Any, landmarks: np.ndarray,
+                            measurements: Dict[str, float], face_shape: str, confidence: float) -> np.ndarray:
+        """
+        Рисует разметку лица, измерения и результат анализа на копии изображения,
+        уменьшенной до MAX_VISUALIZATION_SIDE по длинной стороне.
         
-        # Рисуем основную сетку
+        Args:
+            image: Исходное изображение (BGR)
+            face_landmarks: Лицевые точки в формате MediaPipe
+            landmarks: Массив лицевых точек формы (N, 2) в пикселях
+            measurements: Словарь с измерениями
+            face_shape: Определенная форма лица
+            confidence: Уверенность в определении
+            
+        Returns:
+            Изображение с разметкой
+        """
+        # Рисуем на уменьшенной копии: для Telegram и веб-интерфейса полный размер не нужен
+        height, width = image.shape[:2]
+        scale = min(1.0, self.MAX_VISUALIZATION_SIDE / max(height, width))
+        if scale < 1.0:
+            visualization_image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            landmarks = landmarks * scale
+        else:
+            visualization_image = image.copy()
+        
+        # Рисуем контур лица (полная сетка - это ~2500 отрезков, которые только загромождают картинку)
         self.mp_drawing.draw_landmarks(
             image=visualization_image,
             landmark_list=face_landmarks,
-            connections=self.mp_face_mesh.FACEMESH_TESSELATION,
+            connections=self.mp_face_mesh.FACEMESH_FACE_OVAL,
             landmark_drawing_spec=None,
-            connection_drawing_spec=connection_style
+            connection_drawing_spec=self._connection_style
         )
         
         # Добавляем анализируемые точки более заметно
-        # Обводим ключевые точки для измерений более крупными кругами
-        for idx in self.FACE_OVAL_INDICES + self.CHEEKBONE_INDICES + self.JAW_INDICES + self.FOREHEAD_INDICES:
-            # Сначала рисуем более широкую обводку
-            cv2.circle(visualization_image, 
-                      (int(landmarks[idx][0]), int(landmarks[idx][1])), 
-                      5, (0, 0, 0), 2)  # Черная обводка
-            
-            # Затем рисуем цветную точку внутри
-            cv2.circle(visualization_image, 
-                      (int(landmarks[idx][0]), int(landmarks[idx][1])), 
-                      3, (0, 255, 0), -1)  # Зеленая точка
-        
-        # Получаем измерения лица
-        measurements = self._measure_face(landmarks)
+        self._draw_key_points(visualization_image, landmarks[self._key_idx].astype(np.int32))
         
         # Дополняем визуализацию основными измерениями
         self._draw_measurement_lines(visualization_image, landmarks, measurements)
         
-        # Определяем форму лица
-        face_shape, confidence = self._determine_face_shape(measurements)
-        
         # Добавляем текст с результатом на изображение
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        cv2.putText(visualization_image, 
-                   f"Форма лица: {face_shape.upper()}", 
-                   (10, 30), 
-                   font, 0.7, (255, 255, 255), 4)  # Обводка текста
-        
-        cv2.putText(visualization_image, 
-                   f"Форма лица: {face_shape.upper()}", 
-                   (10, 30), 
-                   font, 0.7, (0, 0, 255), 2)  # Основной текст
+        # Шрифты Hershey в OpenCV не содержат кириллицы, поэтому подписи на картинке - латиницей
+        self._put_label(visualization_image, f"Shape: {face_shape.upper()}",
+                        (10, 30), (0, 0, 255), 0.7, 2)
         
         # Добавляем показатель уверенности
-        conf_text = f"Уверенность: {int(confidence * 100)}%"
-        cv2.putText(visualization_image, 
-                   conf_text, 
-                   (10, 60), 
-                   font, 0.6, (255, 255, 255), 3)  # Обводка
-        
-        cv2.putText(visualization_image, 
-                   conf_text, 
-                   (10, 60), 
-                   font, 0.6, (0, 200, 0), 1)  # Основной текст
-        
-        # Преобразуем изображение с разметкой в base64 для отправки в веб-интерфейс
-        _, buffer = cv2.imencode('.jpg', visualization_image)
-        img_base64 = base64.b64encode(buffer).decode('utf-8')
-        
-        # Создаем словарь с результатами анализа
-        return {
-            "success": True,
-            "face_shape": face_shape,
-            "confidence": confidence,
-            "description": self.FACE_SHAPE_DESCRIPTIONS[face_shape].strip(),
-            "measurements": measurements,
-            "image_with_landmarks": f"data:image/jpeg;base64,{img_base64}"
-        }
+        conf_text = f"Confidence: {int(confidence * 100)}%"
+        self._put_label(visualization_image, conf_text, (10, 60), (0, 200, 0), 0.6)
         
-    def _draw_measurement_lines(self, image: np.ndarray, landmarks: List[Tuple[float, float]], measurements: Dict[str, float]) -> None:
+        return visualization_image
+    
+    def _draw_measurement_lines(self, image: np.ndarray, landmarks: np.ndarray, measurements: Dict[str, float]) -> None:
         """
         Рисует линии основных измерений на изображении для лучшей визуализации.
         
         Args:
             image: Изображение для рисования
-            landmarks: Список лицевых точек
+            landmarks: Массив лицевых точек формы (N, 2)
             measurements: Словарь с измерениями
         """
         # Цвета для разных типов измерений
@@ -239,107 +415,98 @@ class FaceShapeAnalyzer:
         line_thickness = 2
         
         # Рисуем линию ширины лба
-        p1 = (int(landmarks[self.FOREHEAD_INDICES[0]][0]), int(landmarks[self.FOREHEAD_INDICES[0]][1]))
-        p2 = (int(landmarks[self.FOREHEAD_INDICES[1]][0]), int(landmarks[self.FOREHEAD_INDICES[1]][1]))
+        p1 = tuple(landmarks[self.FOREHEAD_INDICES[0]].astype(int).tolist())
+        p2 = tuple(landmarks[self.FOREHEAD_INDICES[1]].astype(int).tolist())
         cv2.line(image, p1, p2, forehead_color, line_thickness)
         
         # Добавляем текст с измерением
         mid_point = ((p1[0] + p2[0]) // 2, (p1[1] + p2[1]) // 2 - 10)
-        cv2.putText(image, f"{int(measurements['forehead_width'])}", mid_point, 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 3)
-        cv2.putText(image, f"{int(measurements['forehead_width'])}", mid_point, 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, forehead_color, 1)
+        self._put_label(image, f"{int(measurements['forehead_width'])}", mid_point, forehead_color)
         
         # Рисуем линию ширины скул
-        p1 = (int(landmarks[self.CHEEKBONE_INDICES[0]][0]), int(landmarks[self.CHEEKBONE_INDICES[0]][1]))
-        p2 = (int(landmarks[self.CHEEKBONE_INDICES[1]][0]), int(landmarks[self.CHEEKBONE_INDICES[1]][1]))
+        p1 = tuple(landmarks[self.CHEEKBONE_INDICES[0]].astype(int).tolist())
+        p2 = tuple(landmarks[self.CHEEKBONE_INDICES[1]].astype(int).tolist())
         cv2.line(image, p1, p2, cheekbone_color, line_thickness)
         
         # Добавляем текст с измерением
         mid_point = ((p1[0] + p2[0]) // 2, (p1[1] + p2[1]) // 2 - 10)
-        cv2.putText(image, f"{int(measurements['cheekbone_width'])}", mid_point, 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 3)
-        cv2.putText(image, f"{int(measurements['cheekbone_width'])}", mid_point, 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, cheekbone_color, 1)
+        self._put_label(image, f"{int(measurements['cheekbone_width'])}", mid_point, cheekbone_color)
         
         # Рисуем линию ширины челюсти
-        p1 = (int(landmarks[self.JAW_INDICES[0]][0]), int(landmarks[self.JAW_INDICES[0]][1]))
-        p2 = (int(landmarks[self.JAW_INDICES[1]][0]), int(landmarks[self.JAW_INDICES[1]][1]))
+        p1 = tuple(landmarks[self.JAW_INDICES[0]].astype(int).tolist())
+        p2 = tuple(landmarks[self.JAW_INDICES[1]].astype(int).tolist())
         cv2.line(image, p1, p2, jaw_color, line_thickness)
         
         # Добавляем текст с измерением
         mid_point = ((p1[0] + p2[0]) // 2, (p1[1] + p2[1]) // 2 + 20)
-        cv2.putText(image, f"{int(measurements['jaw_width'])}", mid_point, 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 3)
-        cv2.putText(image, f"{int(measurements['jaw_width'])}", mid_point, 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, jaw_color, 1)
+        self._put_label(image, f"{int(measurements['jaw_width'])}", mid_point, jaw_color)
         
         # Рисуем линию высоты лица
-        p1 = (int(landmarks[self.FACE_OVAL_INDICES[2]][0]), int(landmarks[self.FACE_OVAL_INDICES[2]][1]))
-        p2 = (int(landmarks[self.FACE_OVAL_INDICES[0]][0]), int(landmarks[self.FACE_OVAL_INDICES[0]][1]))
+        p1 = tuple(landmarks[self.FACE_OVAL_INDICES[2]].astype(int).tolist())
+        p2 = tuple(landmarks[self.FACE_OVAL_INDICES[0]].astype(int).tolist())
         cv2.line(image, p1, p2, height_color, line_thickness)
         
         # Добавляем текст с измерением
         mid_point = (p1[0] + 30, (p1[1] + p2[1]) // 2)
-        cv2.putText(image, f"{int(measurements['face_height'])}", mid_point, 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 3)
-        cv2.putText(image, f"{int(measurements['face_height'])}", mid_point, 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, height_color, 1)
+        self._put_label(image, f"{int(measurements['face_height'])}", mid_point, height_color)
     
-    def _measure_face(self, landmarks: List[Tuple[float, float]]) -> Dict[str, float]:
+    def _draw_key_points(self, image: np.ndarray, points: np.ndarray) -> None:
+        """
+        Ставит маркеры ключевых точек одной векторной операцией.
+        
+        Args:
+            image: Изображение для рисования
+            points: Целочисленные координаты точек формы (N, 2)
+        """
+        coords = (points[:, None, :] + self._marker_offsets[None, :, :]).reshape(-1, 2)
+        colors = np.tile(self._marker_colors, (len(points), 1))
+        
+        # Отбрасываем пиксели маркеров, выходящие за края изображения
+        height, width = image.shape[:2]
+        inside = (coords[:, 0] >= 0) & (coords[:, 0] < width) & (coords[:, 1] >= 0) & (coords[:, 1] < height)
+        image[coords[inside, 1], coords[inside, 0]] = colors[inside]
+    
+    def _put_label(self, image: np.ndarray, text: str, org: Tuple[int, int],
+                   color: Tuple[int, int, int], scale: float = 0.5, thickness: int = 1) -> None:
+        """
+        Рисует подпись на темной подложке за один проход вместо обводки и заливки.
+        
+        Args:
+            image: Изображение для рисования
+            text: Текст подписи
+            org: Левая нижняя точка текста
+            color: Цвет текста (BGR)
+            scale: Масштаб шрифта
+            thickness: Толщина линий текста
+        """
+        (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+        cv2.rectangle(image, (org[0] - 2, org[1] - text_height - 2),
+                      (org[0] + text_width + 2, org[1] + baseline), (0, 0, 0), -1)
+        cv2.putText(image, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness, cv2.LINE_AA)
+    
+    def _measure_face(self, landmarks: np.ndarray) -> Dict[str, float]:
         """
         Perform measurements on the face to determine its shape.
         
         Args:
-            landmarks: List of facial landmarks as (x, y) coordinates
+            landmarks: Array of facial landmarks with shape (N, 2) in pixels
             
         Returns:
             Dictionary with various face measurements
         """
-        # Вычисляем характерные измерения лица
-        
-        # Ширина лица в разных точках
-        forehead_width = self._distance(landmarks[self.FOREHEAD_INDICES[0]], landmarks[self.FOREHEAD_INDICES[1]])
-        cheekbone_width = self._distance(landmarks[self.CHEEKBONE_INDICES[0]], landmarks[self.CHEEKBONE_INDICES[1]])
-        jaw_width = self._distance(landmarks[self.JAW_INDICES[0]], landmarks[self.JAW_INDICES[1]])
-        
-        # Высота лица
-        face_height = self._distance(landmarks[self.FACE_OVAL_INDICES[2]], landmarks[self.FACE_OVAL_INDICES[0]])
-        
-        # Высота нижней части лица (от скул до подбородка)
-        lower_face_height = self._distance(
-            ((landmarks[self.CHEEKBONE_INDICES[0]][0] + landmarks[self.CHEEKBONE_INDICES[1]][0]) / 2,
-             (landmarks[self.CHEEKBONE_INDICES[0]][1] + landmarks[self.CHEEKBONE_INDICES[1]][1]) / 2),
-            landmarks[self.FACE_OVAL_INDICES[0]]
-        )
-        
-        # Расстояние от линии подбородка до линии скул
-        chin_to_jaw_length = self._distance(
-            landmarks[self.FACE_OVAL_INDICES[0]],
-            ((landmarks[self.JAW_INDICES[0]][0] + landmarks[self.JAW_INDICES[1]][0]) / 2,
-             (landmarks[self.JAW_INDICES[0]][1] + landmarks[self.JAW_INDICES[1]][1]) / 2)
-        )
+        # Вычисляем характерные измерения лица: все шесть расстояний одной векторной операцией
+        # (для нижней части лица и подбородка берутся середины линий скул и челюсти)
+        points_a = np.concatenate([landmarks[self._measure_idx_a],
+                                   landmarks[self._measure_mid_idx].mean(axis=1)])
+        distances = np.linalg.norm(points_a - landmarks[self._measure_idx_b], axis=-1)
+        measurements = dict(zip(self._measure_keys, distances.tolist()))
         
         # Соотношения различных измерений
-        face_width_to_height_ratio = cheekbone_width / face_height
-        forehead_to_jaw_ratio = forehead_width / jaw_width
-        cheekbone_to_jaw_ratio = cheekbone_width / jaw_width
-        
-        return {
-            "forehead_width": forehead_width,
-            "cheekbone_width": cheekbone_width,
-            "jaw_width": jaw_width,
-            "face_height": face_height,
-            "lower_face_height": lower_face_height,
-            "chin_to_jaw_length": chin_to_jaw_length,
-            "face_width_to_height_ratio": face_width_to_height_ratio,
-            "forehead_to_jaw_ratio": forehead_to_jaw_ratio,
-            "cheekbone_to_jaw_ratio": cheekbone_to_jaw_ratio
-        }
-    
-    def _distance(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
-        """Calculate Euclidean distance between two points."""
-        return np.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
+        measurements["face_width_to_height_ratio"] = measurements["cheekbone_width"] / measurements["face_height"]
+        measurements["forehead_to_jaw_ratio"] = measurements["forehead_width"] / measurements["jaw_width"]
+        measurements["cheekbone_to_jaw_ratio"] = measurements["cheekbone_width"] / measurements["jaw_width"]
+        
+        return measurements
     
     def _determine_face_shape(self, measurements: Dict[str, float]) -> Tuple[str, float]:
         """
@@ -351,122 +518,34 @@ class FaceShapeAnalyzer:
         Returns:
             Tuple containing (face_shape, confidence)
         """
-        # Создаем словарь для хранения "очков" для каждой формы лица
-        shape_scores = {
-            "oval": 0,
-            "round": 0,
-            "square": 0,
-            "heart": 0,
-            "diamond": 0,
-            "oblong": 0,
-            "triangle": 0
-        }
-        
-        # Улучшенный алгоритм определения формы лица
-        
-        # Овальная форма лица
-        # - Сбалансированные пропорции
-        # - Соотношение ширины к высоте около 2/3
-        # - Мягкая линия подбородка
-        # - Нет выраженных "углов" или чрезмерных пропорций
-        if 0.63 <= measurements["face_width_to_height_ratio"] <= 0.77:
-            shape_scores["oval"] += 2
-        
-        if 0.87 <= measurements["forehead_to_jaw_ratio"] <= 1.13:
-            shape_scores["oval"] += 1
-        
-        if 0.9 <= measurements["cheekbone_to_jaw_ratio"] <= 1.15:
-            shape_scores["oval"] += 1
-        
-        # Круглая форма лица
-        # - Примерно одинаковая ширина и высота
-        # - Скулы - самая широкая часть лица
-        # - Мягкая линия подбородка без выраженных углов
-        if measurements["face_width_to_height_ratio"] >= 0.78:
-            shape_scores["round"] += 3
-        elif measurements["face_width_to_height_ratio"] >= 0.73:
-            shape_scores["round"] += 1
-        
-        if measurements["cheekbone_width"] > measurements["forehead_width"] * 1.05 and measurements["cheekbone_width"] > measurements["jaw_width"] * 1.05:
-            shape_scores["round"] += 2
-        
-        if measurements["chin_to_jaw_length"] < measurements["lower_face_height"] * 0.35:
-            shape_scores["round"] += 1
-        
-        # Квадратная форма лица
-        # - Ширина лба, скул и челюсти примерно одинаковая
-        # - Выраженная линия челюсти с четкими углами
-        if 0.9 <= measurements["forehead_to_jaw_ratio"] <= 1.1 and 0.9 <= measurements["cheekbone_to_jaw_ratio"] <= 1.1:
-            shape_scores["square"] += 3
-        
-        if measurements["chin_to_jaw_length"] < measurements["lower_face_height"] * 0.28:
-            shape_scores["square"] += 2
-        
-        # Сердцевидная форма лица
-        # - Широкий лоб и узкий подбородок
-        # - Сужение лица к подбородку
-        if measurements["forehead_width"] > measurements["jaw_width"] * 1.15:
-            shape_scores["heart"] += 3
-        elif measurements["forehead_width"] > measurements["jaw_width"] * 1.08:
-            shape_scores["heart"] += 1
-        
-        if measurements["forehead_width"] > measurements["cheekbone_width"] * 1.05:
-            shape_scores["heart"] += 2
-        
-        if measurements["chin_to_jaw_length"] > measurements["lower_face_height"] * 0.38:
-            shape_scores["heart"] += 1
-        
-        # Ромбовидная форма лица
-        # - Скулы - самая широкая часть лица
-        # - Лоб и подбородок уже чем скулы
-        if measurements["cheekbone_width"] > measurements["forehead_width"] * 1.13 and measurements["cheekbone_width"] > measurements["jaw_width"] * 1.13:
-            shape_scores["diamond"] += 3
-        elif measurements["cheekbone_width"] > measurements["forehead_width"] * 1.05 and measurements["cheekbone_width"] > measurements["jaw_width"] * 1.05:
-            shape_scores["diamond"] += 1
-        
-        # Проверяем, что лоб и подбородок сужены по сравнению со скулами
-        narrow_top_bottom = (measurements["cheekbone_width"] - measurements["forehead_width"]) > 0 and (measurements["cheekbone_width"] - measurements["jaw_width"]) > 0
-        if narrow_top_bottom:
-            shape_scores["diamond"] += 2
-        
-        # Продолговатая форма лица
-        # - Длинное лицо с примерно одинаковой шириной лба, скул и челюсти
-        # - Соотношение высоты к ширине больше чем у овального
-        if measurements["face_width_to_height_ratio"] < 0.62:
-            shape_scores["oblong"] += 3
-        elif measurements["face_width_to_height_ratio"] < 0.67:
-            shape_scores["oblong"] += 1
-        
-        if 0.85 <= measurements["forehead_to_jaw_ratio"] <= 1.15 and 0.85 <= measurements["cheekbone_to_jaw_ratio"] <= 1.15:
-            shape_scores["oblong"] += 2
-        
-        # Треугольная форма лица (основание вниз)
-        # - Узкий лоб и широкая челюсть
-        # - Обратная форма сердца
-        if measurements["jaw_width"] > measurements["forehead_width"] * 1.15:
-            shape_scores["triangle"] += 3
-        elif measurements["jaw_width"] > measurements["forehead_width"] * 1.05:
-            shape_scores["triangle"] += 1
-        
-        if measurements["jaw_width"] > measurements["cheekbone_width"] * 1.05:
-            shape_scores["triangle"] += 2
-        
-        # Логируем очки для отладки
-        logging.debug(f"Shape scores: {shape_scores}")
-        logging.debug(f"Measurements: {measurements}")
-        
-        # Определяем форму с наибольшим количеством очков
-        max_score = max(shape_scores.values())
-        
-        # Находим все формы с максимальным количеством очков
-        top_shapes = [shape for shape, score in shape_scores.items() if score == max_score]
-        
-        # Если есть несколько форм с одинаковым количеством очков, выбираем приоритетную
-        # Приоритет: oval > heart > diamond > round > square > oblong > triangle
-        priority_order = ["oval", "heart", "diamond", "round", "square", "oblong", "triangle"]
-        
-        # Выбираем форму с наивысшим приоритетом из top_shapes
-        face_shape = next((shape for shape in priority_order if shape in top_shapes), "oval")
+        m = measurements
+        features = np.array([
+            m["face_width_to_height_ratio"],
+            m["forehead_to_jaw_ratio"],
+            m["cheekbone_to_jaw_ratio"],
+            m["cheekbone_width"] / max(m["forehead_width"], m["jaw_width"]),
+            m["forehead_width"] / m["cheekbone_width"],
+            m["jaw_width"] / m["forehead_width"],
+            m["jaw_width"] / m["cheekbone_width"],
+            m["chin_to_jaw_length"] / m["lower_face_height"],
+        ])
+        
+        # Начисляем очки всем формам лица сразу по таблице правил
+        hits = ((features >= self._low) & (features <= self._high)).all(axis=1)
+        scores = hits.astype(np.int64) @ self._weights
+        for shape_idx, feature_idx, thresholds, points, side in self._staircases:
+            scores[shape_idx] += points[np.searchsorted(thresholds, features[feature_idx], side=side)]
+        
+        # Логируем очки для отладки; словарь очков собираем, только если DEBUG включен
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Shape scores: %s", dict(zip(self._shapes, scores.tolist())))
+            logging.debug("Measurements: %s", measurements)
+        
+        # Определяем форму с наибольшим количеством очков; argmax возвращает первую
+        # из равных, а формы упорядочены по приоритету
+        best = int(scores.argmax())
+        face_shape = self._shapes[best]
+        max_score = int(scores[best])
         
         # Рассчитываем уверенность в определении формы
         # (от 0.55 до 1.0 в зависимости от количества очков)
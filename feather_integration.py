@@ -2,17 +2,191 @@
 # -*- coding: utf-8 -*-
 
 import os
+import base64
+import orjson
 import requests
 import logging
-from typing import Dict, Any, Optional, List, Union
+from types import MappingProxyType
+from functools import cached_property
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Any, Optional, List, Tuple, Union
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Логгер модуля; настройка логирования выполняется в точке входа приложения
 logger = logging.getLogger(__name__)
 
+# Повторы с экспоненциальной задержкой при временных сбоях Telegram API
+TELEGRAM_RETRY = Retry(
+    total=4,
+    backoff_factor=0.3,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET", "POST"),
+    respect_retry_after_header=True,
+)
+
+# Максимальная длина подписи к фото в Telegram Bot API
+MAX_CAPTION_LENGTH = 1024
+
+# Тела JSON-запросов сериализуются orjson, поэтому тип содержимого указывается явно
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Экранирование служебных символов Markdown, чтобы Telegram не отклонял сообщение с ошибкой 400
+_MD_ESCAPE = str.maketrans({c: "\\" + c for c in "_*`["})
+
+# Рекомендации по прическам, аксессуарам и макияжу для каждой формы лица (неизменяемые таблицы)
+_RECOMMENDATIONS = MappingProxyType({
+    "oval": {
+        "haircuts": (
+            "Практически любые прически и длина волос",
+            "Длинные волосы с легкими волнами",
+            "Короткие стрижки типа пикси",
+            "Средняя длина с многослойными стрижками"
+        ),
+        "accessories": (
+            "Подходят практически любые формы очков",
+            "Круглые, квадратные или кошачьи очки",
+            "Серьги любой формы и размера"
+        ),
+        "makeup": (
+            "Не требуется сильная коррекция, используйте легкое контурирование",
+            "Выделяйте глаза или губы по желанию",
+            "Румяна наносите на яблочки щек"
+        )
+    },
+    "round": {
+        "haircuts": (
+            "Асимметричные стрижки для визуального удлинения лица",
+            "Длинные многослойные стрижки",
+            "Прямые или волнистые волосы ниже подбородка",
+            "Избегайте очень коротких и пышных причесок"
+        ),
+        "accessories": (
+            "Прямоугольные или квадратные очки",
+            "Избегайте круглых оправ, так как они подчеркнут округлость",
+            "Длинные серьги, визуально удлиняющие лицо"
+        ),
+        "makeup": (
+            "Контурирование скул для придания им более выраженной формы",
+            "Удлиняющее контурирование по линии роста волос и под скулами",
+            "Румяна наносите ниже скул, а не на яблочки щек"
+        )
+    },
+    "square": {
+        "haircuts": (
+            "Мягкие волны и кудри для смягчения углов",
+            "Длинная челка набок",
+            "Объем в области висков",
+            "Многослойные стрижки средней длины"
+        ),
+        "accessories": (
+            "Круглые или овальные очки для смягчения углов",
+            "Избегайте квадратных и прямоугольных оправ",
+            "Круглые серьги или серьги с мягкими изгибами"
+        ),
+        "makeup": (
+            "Смягчающее контурирование углов челюсти",
+            "Румяна на яблочках щек для придания мягкости",
+            "Округлые формы в макияже бровей"
+        )
+    },
+    "heart": {
+        "haircuts": (
+            "Объемные прически от средней линии ушей и ниже",
+            "Прически с пробором посередине",
+            "Удлиненный боб или лоб длиной до подбородка",
+            "Многослойные стрижки с акцентом на нижнюю часть лица"
+        ),
+        "accessories": (
+            "Очки нижней оправой или без оправы",
+            "Очки кошачий глаз, сбалансируют верхнюю и нижнюю части лица",
+            "Объемные серьги, привлекающие внимание к нижней части лица"
+        ),
+        "makeup": (
+            "Контурирование висков и лба для визуального сужения",
+            "Хайлайтер на подбородок для визуального расширения",
+            "Румяна на средней линии щек"
+        )
+    },
+    "diamond": {
+        "haircuts": (
+            "Прически с объемом в области подбородка",
+            "Длинные многослойные стрижки",
+            "Челки для визуального сокращения высоты лба",
+            "Боб с удлинением к подбородку"
+        ),
+        "accessories": (
+            "Очки с закругленными краями или овальные",
+            "Очки с верхней оправой или без оправы",
+            "Объемные серьги, привлекающие внимание к нижней части лица"
+        ),
+        "makeup": (
+            "Контурирование скул для их смягчения",
+            "Румяна на яблочках щек",
+            "Акцент на глаза и губы"
+        )
+    },
+    "oblong": {
+        "haircuts": (
+            "Прически с объемом по бокам",
+            "Многослойные стрижки средней длины",
+            "Прямая или косая челка для визуального уменьшения длины лица",
+            "Избегайте чрезмерно длинных и прямых причесок"
+        ),
+        "accessories": (
+            "Широкие очки с горизонтальными акцентами",
+            "Круглые очки для смягчения вытянутости",
+            "Короткие, объемные серьги"
+        ),
+        "makeup": (
+            "Контурирование лба и подбородка для визуального укорочения",
+            "Использование румян на скулах по горизонтали",
+            "Широкие формы в макияже бровей"
+        )
+    },
+    "triangle": {
+        "haircuts": (
+            "Объем в верхней части головы и у висков",
+            "Короткие или средней длины стрижки",
+            "Многослойные прически с объемом на макушке",
+            "Челка для балансировки пропорций"
+        ),
+        "accessories": (
+            "Очки с акцентом на верхнюю часть оправы",
+            "Оправы кошачий глаз или очки-авиаторы",
+            "Объемные серьги, акцентирующие верхнюю часть лица"
+        ),
+        "makeup": (
+            "Акцент на глаза и брови",
+            "Контурирование линии челюсти для её визуального сужения",
+            "Румяна на скулах и чуть выше"
+        )
+    }
+})
+
+def _render_recommendations(face_shape: str, recommendations: Dict[str, Tuple[str, ...]]) -> str:
+    """Формирует текст сообщения с рекомендациями для формы лица."""
+    def bullets(items: List[str]) -> str:
+        return "".join(f"• {item.translate(_MD_ESCAPE)}\n" for item in items)
+    
+    return (
+        f"✨ *Рекомендации для {face_shape.upper()} формы лица*\n\n"
+        f"💇 *Прически*:\n{bullets(recommendations['haircuts'])}"
+        f"\n👓 *Очки и аксессуары*:\n{bullets(recommendations['accessories'])}"
+        f"\n💄 *Макияж*:\n{bullets(recommendations['makeup'])}"
+    )
+
+# Готовые тексты сообщений с рекомендациями: данные статичны, поэтому собираем их один раз
+_RECOMMENDATION_MESSAGES = {
+    shape: _render_recommendations(shape, recommendations)
+    for shape, recommendations in _RECOMMENDATIONS.items()
+}
+
+def _normalize_chat_id(chat_id: Union[int, str]) -> Union[int, str]:
+    """Приводит числовой ID чата к int; @username каналов оставляет строкой."""
+    if isinstance(chat_id, str) and chat_id.removeprefix("-").isdecimal():
+        return int(chat_id)
+    return chat_id
+
 class TelegramBotAPI:
     """Класс для интеграции с Telegram Bot API для отправки результатов анализа."""
     
@@ -24,10 +198,38 @@ class TelegramBotAPI:
         else:
             logger.warning("Токен Telegram Bot не найден в переменных окружения. Интеграция не будет работать.")
             self.api_url = None
+        
+        # URL методов API вычисляются один раз, а не при каждом запросе
+        self._configured = self.api_url is not None
+        if self._configured:
+            self._url_send_message = self.api_url + "/sendMessage"
+            self._url_send_photo = self.api_url + "/sendPhoto"
+        else:
+            self._url_send_message = self._url_send_photo = None
+        
+    # Сессии с пулом keep-alive соединений к api.telegram.org создаются при первом использовании:
+    # отдельная для загрузки фото, чтобы большие запросы не занимали соединения коротких сообщений
+    @cached_property
+    def session(self) -> requests.Session:
+        """HTTP-сессия для текстовых сообщений."""
+        return self._create_session()
+    
+    @cached_property
+    def upload_session(self) -> requests.Session:
+        """HTTP-сессия для загрузки изображений."""
+        return self._create_session()
+    
+    @staticmethod
+    def _create_session() -> requests.Session:
+        """Создает HTTP-сессию с пулом соединений для Telegram Bot API."""
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                                                 max_retries=TELEGRAM_RETRY))
+        return session
     
     def is_configured(self) -> bool:
         """Проверка, настроен ли API клиент."""
-        return self.token is not None and self.api_url is not None
+        return self._configured
     
     def send_analysis_result(self, chat_id: str, face_shape: str, 
                           description: str, confidence: float, 
@@ -43,269 +245,142 @@ class TelegramBotAPI:
             image_data: Base64-закодированное изображение с разметкой лица (опционально)
             
         Returns:
-            Словарь с результатом отправки сообщения
+            Словарь с результатом отправки сообщения; ключ "recommendations_sent"
+            сообщает, были ли доставлены рекомендации по стилю
         """
         if not self.is_configured():
             logger.error("API клиент не настроен. Невозможно отправить результат анализа.")
             return {"ok": False, "error": "API клиент не настроен"}
         
-        # Формируем сообщение с результатом анализа
-        message_text = (
-            f"🔍 *Результаты анализа лица*\n\n"
-            f"👤 *Форма лица*: {face_shape.upper()}\n\n"
-            f"📝 *Описание*: {description}\n\n"
-            f"🎯 *Уверенность*: {int(confidence * 100)}%"
-        )
+        chat_id = _normalize_chat_id(chat_id)
+        
+        # Формируем сообщение с результатом анализа; пустое описание пропускаем
+        parts = [
+            "🔍 *Результаты анализа лица*",
+            f"👤 *Форма лица*: {face_shape.upper().translate(_MD_ESCAPE)}",
+        ]
+        if description:
+            parts.append(f"📝 *Описание*: {description.translate(_MD_ESCAPE)}")
+        parts.append(f"🎯 *Уверенность*: {int(confidence * 100)}%")
+        message_text = "\n\n".join(parts)
         
         try:
-            # Отправляем текстовое сообщение
-            text_response = requests.post(
-                f"{self.api_url}/sendMessage",
-                json={
-                    "chat_id": chat_id,
-                    "text": message_text,
-                    "parse_mode": "Markdown"
-                },
-                timeout=10
-            )
+            # Если есть изображение и текст помещается в подпись, отправляем результат одним sendPhoto
+            if (image_data and image_data.startswith("data:image")
+                    and len(message_text) <= MAX_CAPTION_LENGTH):
+                photo_result = self._send_analysis_image(chat_id, image_data,
+                                                         caption=message_text, parse_mode="Markdown")
+                if not photo_result.get("ok"):
+                    # Не удалось отправить фото - отправляем результат текстом
+                    photo_result = self._send_text(chat_id, message_text)
+                
+                # Рекомендации отправляем после результата, чтобы пользователь получил их следом
+                recommendations_result = self.send_recommendations(chat_id, face_shape)
+                photo_result["recommendations_sent"] = recommendations_result.get("ok", False)
+                return photo_result
             
-            text_result = text_response.json()
+            # Отправляем текстовое сообщение
+            text_result = self._send_text(chat_id, message_text)
             
-            # Если есть изображение с разметкой, отправляем его
+            # Если текст успешно отправлен и есть изображение, отправляем его
             if image_data and text_result.get("ok"):
-                # Проверяем, начинается ли строка с data:image
-                if image_data.startswith("data:image"):
-                    # Извлекаем только данные base64 (удаляем префикс data:image/jpeg;base64,)
-                    import base64
-                    from io import BytesIO
-                    
-                    # Получаем только закодированные данные
-                    img_data = image_data.split(',')[1]
-                    img_binary = base64.b64decode(img_data)
-                    
-                    # Создаем объект BytesIO для отправки
-                    img_io = BytesIO(img_binary)
-                    img_io.name = 'face_analysis.jpg'
-                    
-                    # Отправляем изображение
-                    files = {"photo": img_io}
-                    photo_response = requests.post(
-                        f"{self.api_url}/sendPhoto",
-                        data={"chat_id": chat_id, "caption": "Анализ лица с разметкой ключевых точек"},
-                        files=files,
-                        timeout=10
-                    )
-                    
-                    photo_result = photo_response.json()
-                    if not photo_result.get("ok"):
-                        logger.error(f"Ошибка при отправке изображения: {photo_result}")
+                self._send_analysis_image(chat_id, image_data)
             
             # Отправляем рекомендации по стилю
-            self.send_recommendations(chat_id, face_shape)
-            
+            recommendations_result = self.send_recommendations(chat_id, face_shape)
+            text_result["recommendations_sent"] = recommendations_result.get("ok", False)
             return text_result
             
         except Exception as e:
-            logger.error(f"Ошибка при отправке результата анализа: {str(e)}")
+            logger.error("Ошибка при отправке результата анализа: %s", e)
             return {"ok": False, "error": str(e)}
     
-    def send_recommendations(self, chat_id: str, face_shape: str) -> Dict[str, Any]:
+    def _send_text(self, chat_id: str, message_text: str) -> Dict[str, Any]:
+        """Отправляет текстовое сообщение в формате Markdown."""
+        response = self.session.post(
+            self._url_send_message,
+            data=orjson.dumps({
+                "chat_id": chat_id,
+                "text": message_text,
+                "parse_mode": "Markdown"
+            }),
+            headers=JSON_HEADERS,
+            timeout=10
+        )
+        return response.json()
+    
+    def _send_analysis_image(self, chat_id: str, image_data: str,
+                             caption: str = "Анализ лица с разметкой ключевых точек",
+                             parse_mode: Optional[str] = None) -> Dict[str, Any]:
         """
-        Отправляет рекомендации по прическам и стилю для данной формы лица.
+        Отправляет изображение с разметкой лица.
         
         Args:
             chat_id: ID чата для отправки сообщения
-            face_shape: Форма лица
+            image_data: Изображение в виде data URL (data:image/jpeg;base64,...)
+            caption: Подпись к изображению (не длиннее MAX_CAPTION_LENGTH)
+            parse_mode: Режим разметки подписи (например, "Markdown")
             
         Returns:
-            Словарь с результатом отправки сообщения
+            Словарь с результатом отправки изображения
         """
-        if not self.is_configured():
-            logger.error("API клиент не настроен. Невозможно отправить рекомендации.")
-            return {"ok": False, "error": "API клиент не настроен"}
-        
-        # Получаем рекомендации для данной формы лица
-        recommendations = self._get_recommendations_for_face_shape(face_shape)
-        
-        # Формируем сообщение с рекомендациями
-        message_text = (
-            f"✨ *Рекомендации для {face_shape.upper()} формы лица*\n\n"
-            f"💇 *Прически*:\n"
-        )
-        
-        # Добавляем рекомендации по прическам
-        for haircut in recommendations.get("haircuts", []):
-            message_text += f"• {haircut}\n"
-        
-        message_text += "\n👓 *Очки и аксессуары*:\n"
-        
-        # Добавляем рекомендации по аксессуарам
-        for accessory in recommendations.get("accessories", []):
-            message_text += f"• {accessory}\n"
-        
-        message_text += "\n💄 *Макияж*:\n"
-        
-        # Добавляем рекомендации по макияжу
-        for makeup in recommendations.get("makeup", []):
-            message_text += f"• {makeup}\n"
+        # Проверяем, начинается ли строка с data:image
+        if not image_data.startswith("data:image"):
+            return {"ok": False, "error": "Неподдерживаемый формат изображения"}
         
         try:
-            # Отправляем сообщение
-            response = requests.post(
-                f"{self.api_url}/sendMessage",
-                json={
-                    "chat_id": chat_id,
-                    "text": message_text,
-                    "parse_mode": "Markdown"
-                },
+            # Декодируем данные base64 после префикса data:image/jpeg;base64,
+            comma = image_data.find(',')
+            img_binary = base64.b64decode(image_data[comma + 1:])
+            
+            data = {"chat_id": chat_id, "caption": caption[:MAX_CAPTION_LENGTH]}
+            if parse_mode:
+                data["parse_mode"] = parse_mode
+            
+            # Отправляем изображение
+            photo_response = self.upload_session.post(
+                self._url_send_photo,
+                data=data,
+                files={"photo": ("face_analysis.jpg", img_binary, "image/jpeg")},
                 timeout=10
             )
             
-            return response.json()
+            photo_result = photo_response.json()
+            if not photo_result.get("ok"):
+                logger.error("Ошибка при отправке изображения: %s", photo_result)
+            return photo_result
             
         except Exception as e:
-            logger.error(f"Ошибка при отправке рекомендаций: {str(e)}")
+            logger.error("Ошибка при отправке изображения: %s", e)
             return {"ok": False, "error": str(e)}
     
-    def _get_recommendations_for_face_shape(self, face_shape: str) -> Dict[str, List[str]]:
+    def send_recommendations(self, chat_id: str, face_shape: str) -> Dict[str, Any]:
         """
-        Возвращает рекомендации по прическам и аксессуарам для данной формы лица.
+        Отправляет рекомендации по прическам и стилю для данной формы лица.
         
         Args:
+            chat_id: ID чата для отправки сообщения
             face_shape: Форма лица
             
         Returns:
-            Словарь с рекомендациями
+            Словарь с результатом отправки сообщения
         """
-        recommendations = {
-            "oval": {
-                "haircuts": [
-                    "Практически любые прически и длина волос",
-                    "Длинные волосы с легкими волнами",
-                    "Короткие стрижки типа пикси",
-                    "Средняя длина с многослойными стрижками"
-                ],
-                "accessories": [
-                    "Подходят практически любые формы очков",
-                    "Круглые, квадратные или кошачьи очки",
-                    "Серьги любой формы и размера"
-                ],
-                "makeup": [
-                    "Не требуется сильная коррекция, используйте легкое контурирование",
-                    "Выделяйте глаза или губы по желанию",
-                    "Румяна наносите на яблочки щек"
-                ]
-            },
-            "round": {
-                "haircuts": [
-                    "Асимметричные стрижки для визуального удлинения лица",
-                    "Длинные многослойные стрижки",
-                    "Прямые или волнистые волосы ниже подбородка",
-                    "Избегайте очень коротких и пышных причесок"
-                ],
-                "accessories": [
-                    "Прямоугольные или квадратные очки",
-                    "Избегайте круглых оправ, так как они подчеркнут округлость",
-                    "Длинные серьги, визуально удлиняющие лицо"
-                ],
-                "makeup": [
-                    "Контурирование скул для придания им более выраженной формы",
-                    "Удлиняющее контурирование по линии роста волос и под скулами",
-                    "Румяна наносите ниже скул, а не на яблочки щек"
-                ]
-            },
-            "square": {
-                "haircuts": [
-                    "Мягкие волны и кудри для смягчения углов",
-                    "Длинная челка набок",
-                    "Объем в области висков",
-                    "Многослойные стрижки средней длины"
-                ],
-                "accessories": [
-                    "Круглые или овальные очки для смягчения углов",
-                    "Избегайте квадратных и прямоугольных оправ",
-                    "Круглые серьги или серьги с мягкими изгибами"
-                ],
-                "makeup": [
-                    "Смягчающее контурирование углов челюсти",
-                    "Румяна на яблочках щек для придания мягкости",
-                    "Округлые формы в макияже бровей"
-                ]
-            },
-            "heart": {
-                "haircuts": [
-                    "Объемные прически от средней линии ушей и ниже",
-                    "Прически с пробором посередине",
-                    "Удлиненный боб или лоб длиной до подбородка",
-                    "Многослойные стрижки с акцентом на нижнюю часть лица"
-                ],
-                "accessories": [
-                    "Очки нижней оправой или без оправы",
-                    "Очки кошачий глаз, сбалансируют верхнюю и нижнюю части лица",
-                    "Объемные серьги, привлекающие внимание к нижней части лица"
-                ],
-                "makeup": [
-                    "Контурирование висков и лба для визуального сужения",
-                    "Хайлайтер на подбородок для визуального расширения",
-                    "Румяна на средней линии щек"
-                ]
-            },
-            "diamond": {
-                "haircuts": [
-                    "Прически с объемом в области подбородка",
-                    "Длинные многослойные стрижки",
-                    "Челки для визуального сокращения высоты лба",
-                    "Боб с удлинением к подбородку"
-                ],
-                "accessories": [
-                    "Очки с закругленными краями или овальные",
-                    "Очки с верхней оправой или без оправы",
-                    "Объемные серьги, привлекающие внимание к нижней части лица"
-                ],
-                "makeup": [
-                    "Контурирование скул для их смягчения",
-                    "Румяна на яблочках щек",
-                    "Акцент на глаза и губы"
-                ]
-            },
-            "oblong": {
-                "haircuts": [
-                    "Прически с объемом по бокам",
-                    "Многослойные стрижки средней длины",
-                    "Прямая или косая челка для визуального уменьшения длины лица",
-                    "Избегайте чрезмерно длинных и прямых причесок"
-                ],
-                "accessories": [
-                    "Широкие очки с горизонтальными акцентами",
-                    "Круглые очки для смягчения вытянутости",
-                    "Короткие, объемные серьги"
-                ],
-                "makeup": [
-                    "Контурирование лба и подбородка для визуального укорочения",
-                    "Использование румян на скулах по горизонтали",
-                    "Широкие формы в макияже бровей"
-                ]
-            },
-            "triangle": {
-                "haircuts": [
-                    "Объем в верхней части головы и у висков",
-                    "Короткие или средней длины стрижки",
-                    "Многослойные прически с объемом на макушке",
-                    "Челка для балансировки пропорций"
-                ],
-                "accessories": [
-                    "Очки с акцентом на верхнюю часть оправы",
-                    "Оправы кошачий глаз или очки-авиаторы",
-                    "Объемные серьги, акцентирующие верхнюю часть лица"
-                ],
-                "makeup": [
-                    "Акцент на глаза и брови",
-                    "Контурирование линии челюсти для её визуального сужения",
-                    "Румяна на скулах и чуть выше"
-                ]
-            }
-        }
+        if not self.is_configured():
+            logger.error("API клиент не настроен. Невозможно отправить рекомендации.")
+            return {"ok": False, "error": "API клиент не настроен"}
         
-        # Возвращаем рекомендации для заданной формы лица
-        # Если форма не распознана, возвращаем для овального лица
-        return recommendations.get(face_shape.lower(), recommendations["oval"])
\ No newline at end of file
+        chat_id = _normalize_chat_id(chat_id)
+        
+        # Берем готовое сообщение с рекомендациями для данной формы лица
+        message_text = _RECOMMENDATION_MESSAGES.get(face_shape.lower(), _RECOMMENDATION_MESSAGES["oval"])
+        
+        try:
+            # Отправляем сообщение
+            return self._send_text(chat_id, message_text)
+            
+        except Exception as e:
+            logger.error("Ошибка при отправке рекомендаций: %s", e)
+            return {"ok": False, "error": str(e)}
+
+# Общий экземпляр клиента для всего процесса: соединения с Telegram переиспользуются между запросами
+telegram_api = TelegramBotAPI()
@@ -5,5 +5,6 @@ from app import app
 logging.basicConfig(level=logging.DEBUG)
 
 if __name__ == "__main__":
-    # Start the Flask application on port 5001 to avoid conflicts with gunicorn
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    # Local development server on port 5001 to avoid conflicts with gunicorn;
+    # production runs through wsgi.py (see Procfile)
+    app.run(host="0.0.0.0", port=5001, debug=False, use_reloader=False)
@@ -3,11 +3,13 @@
 
 import os
 import sys
+import json
 import time
 import logging
 import subprocess
 import signal
-import requests
+import urllib3
+from urllib3.util.retry import Retry
 
 # Настройка логирования
 logging.basicConfig(
@@ -28,36 +30,50 @@ if not TOKEN:
 # URL Telegram Bot API
 API_URL = f"https://api.telegram.org/bot{TOKEN}"
 
+# Пул соединений для проверок статуса: повторы с экспоненциальной задержкой при временных сбоях
+_retry = Retry(
+    total=4,
+    backoff_factor=0.3,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=("GET", "POST"),
+    respect_retry_after_header=True,
+)
+_http = urllib3.PoolManager(num_pools=2, maxsize=2, retries=_retry)
+
 def check_flask_status():
     """Проверяет статус Flask приложения."""
     try:
-        response = requests.get(STATUS_URL, timeout=5)
-        return response.status_code == 200
+        response = _http.request("GET", STATUS_URL, timeout=urllib3.Timeout(5.0))
+        return response.status == 200
     except:
         return False
 
 def check_bot_status():
     """Проверяет статус соединения бота с Telegram API."""
     try:
-        response = requests.get(f"{API_URL}/getMe", timeout=10)
-        return response.json().get("ok", False)
+        response = _http.request("GET", f"{API_URL}/getMe", timeout=urllib3.Timeout(10.0))
+        return json.loads(response.data).get("ok", False)
     except:
         return False
 
 def start_bot_process():
     """Запускает процесс бота."""
     try:
-        # Запускаем бота как отдельный процесс
+        # Если задан URL вебхука, бот получает обновления через webhook вместо опроса
+        env = os.environ.copy()
+        if env.get("WEBHOOK_URL"):
+            env.setdefault("BOT_MODE", "webhook")
+        
+        # Запускаем бота как отдельный процесс. Вывод наследуется от текущего процесса:
+        # непрочитанный PIPE заполнился бы и заблокировал логирование в боте
         process = subprocess.Popen(
             ["python", "bot_server.py"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+            env=env
         )
-        logger.info(f"Бот запущен с PID {process.pid}")
+        logger.info("Бот запущен с PID %s", process.pid)
         return process
     except Exception as e:
-        logger.error(f"Не удалось запустить бот: {str(e)}")
+        logger.error("Не удалось запустить бот: %s", e)
         return None
 
 def main():
@@ -83,39 +99,15 @@ def main():
             bot_process.terminate()
             return
         
-        # Основной цикл мониторинга
-        consecutive_failures = 0
-        max_consecutive_failures = 3
-        
+        # Основной цикл мониторинга: блокируемся до завершения процесса бота вместо периодического опроса.
+        # Если доступен systemd, вместо этого скрипта лучше использовать bot.service (Restart=on-failure)
         while True:
-            # Проверяем статус процесса
-            if bot_process.poll() is not None:
-                logger.warning(f"Процесс бота завершился с кодом {bot_process.returncode}. Перезапуск...")
-                bot_process = start_bot_process()
-                if not bot_process:
-                    break
-                time.sleep(5)
-                consecutive_failures = 0
-            
-            # Проверяем соединение с Telegram API
-            if not check_bot_status():
-                consecutive_failures += 1
-                logger.warning(f"Неудачная проверка соединения ({consecutive_failures}/{max_consecutive_failures})")
-                
-                if consecutive_failures >= max_consecutive_failures:
-                    logger.error("Слишком много ошибок подряд. Перезапуск бота...")
-                    bot_process.terminate()
-                    time.sleep(2)
-                    bot_process = start_bot_process()
-                    if not bot_process:
-                        break
-                    time.sleep(5)
-                    consecutive_failures = 0
-            else:
-                consecutive_failures = 0
-            
-            # Пауза между проверками
-            time.sleep(60)
+            returncode = bot_process.wait()
+            logger.warning("Процесс бота завершился с кодом %s. Перезапуск...", returncode)
+            bot_process = start_bot_process()
+            if not bot_process:
+                break
+            time.sleep(5)
     
     except KeyboardInterrupt:
         logger.info("Получен сигнал завершения. Остановка бота...")
@@ -3,17 +3,19 @@
 
 import os
 import sys
+import http.client
 import logging
-import json
+import orjson
 import requests
-import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import queue
+import random
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List, Union
-from io import BytesIO
-import tempfile
-
-import cv2
-import numpy as np
+from feather_integration import JSON_HEADERS
 
 # Настройка логирования
 logging.basicConfig(
@@ -21,6 +23,8 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# urllib3 пишет в лог каждое новое соединение - оставляем только предупреждения
+logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 # Получаем токен из переменных окружения
 TOKEN = os.environ.get("BOT_FEATHER_TOKEN")
@@ -31,34 +35,103 @@ if not TOKEN:
 # URL Telegram Bot API
 API_URL = f"https://api.telegram.org/bot{TOKEN}"
 
+# URL методов API, собранные один раз
+_URL_SEND_MESSAGE = f"{API_URL}/sendMessage"
+_URL_SEND_PHOTO = f"{API_URL}/sendPhoto"
+_URL_GET_FILE = f"{API_URL}/getFile"
+_URL_GET_UPDATES = f"{API_URL}/getUpdates"
+_PATH_GET_UPDATES = f"/bot{TOKEN}/getUpdates"
+_URL_SET_WEBHOOK = f"{API_URL}/setWebhook"
+_URL_GET_ME = f"{API_URL}/getMe"
+_URL_FILE_BASE = f"https://api.telegram.org/file/bot{TOKEN}/"
+
 # URL для анализа лица (API нашего приложения)
- FACE_ANALYZER_URL = "https://face-1-naum.onrender.com/analyze" # gunicorn сервер работает на порту 5000
+FACE_ANALYZER_URL = "https://face-1-naum.onrender.com/analyze" # gunicorn сервер работает на порту 5000
+
+# Режим анализа: "http" - запрос к FACE_ANALYZER_URL, "local" - вызов анализатора в этом же процессе
+# (если бот и приложение анализа работают на одном сервере; без HTTP и multipart-кодирования)
+FACE_ANALYZER_MODE = os.environ.get("FACE_ANALYZER_MODE", "http").lower()
+
+# Отдельное постоянное соединение для long polling getUpdates: запрос выполняется непрерывно,
+# поэтому идет напрямую через http.client, без обвязки requests. Используется только потоком опроса
+_POLL_CONN = http.client.HTTPSConnection("api.telegram.org", timeout=60)
+# http.client не учитывает HTTPS_PROXY/NO_PROXY: если для Telegram задан прокси, опрос идет через SESSION
+_POLL_VIA_SESSION = bool(requests.utils.get_environ_proxies(API_URL))
+
+# Сессии с пулом keep-alive соединений: к api.telegram.org и к серверу анализа (другой хост).
+# Запросы к Telegram (включая getFile и скачивание файлов) повторяются при временных ошибках 5xx;
+# после исчерпания попыток вызывающий код получает последний ответ, а не исключение
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4, pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504],
+                      allowed_methods=["GET", "POST"], raise_on_status=False)
+))
+# К серверу анализа повторяются только обрывы соединения и ответы 502/503/504 на идемпотентные запросы
+ANALYZER_SESSION = requests.Session()
+for _prefix in ("http://", "https://"):
+    ANALYZER_SESSION.mount(_prefix, HTTPAdapter(
+        pool_connections=1, pool_maxsize=16,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    ))
+
+class BufferPool:
+    """Пул переиспользуемых буферов для скачивания фотографий."""
+    
+    def __init__(self, buffer_size: int, max_buffers: int):
+        self.buffer_size = buffer_size
+        self._buffers = queue.LifoQueue(maxsize=max_buffers)
+    
+    def acquire(self) -> bytearray:
+        """Возвращает свободный буфер из пула или выделяет новый."""
+        try:
+            return self._buffers.get_nowait()
+        except queue.Empty:
+            return bytearray(self.buffer_size)
+    
+    def release(self, buf: bytearray) -> None:
+        """Возвращает буфер в пул; лишние буферы отдаются сборщику мусора."""
+        if len(buf) != self.buffer_size:
+            return
+        try:
+            self._buffers.put_nowait(buf)
+        except queue.Full:
+            pass
+
+# Буферы под фотографии: большинство фото из Telegram меньше 2 МБ
+PHOTO_BUFFERS = BufferPool(buffer_size=2_000_000, max_buffers=32)
+
+# Типы обновлений, которые обрабатывает бот
+ALLOWED_UPDATES = ["message"]
+
+# Пул потоков для обработки обновлений: медленный анализ фото одного пользователя не задерживает опрос
+EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="tg-update")
 
 # Настройки бота
 HELP_MESSAGE = """
-🤖 *Анализатор формы лица Бот*
+🤖 <b>Анализатор формы лица Бот</b>
 
 Этот бот поможет определить форму вашего лица и предоставит рекомендации по стилю, прическам и аксессуарам.
 
-*Как пользоваться:*
+<b>Как пользоваться:</b>
 1. Отправьте фотографию своего лица
 2. Подождите пока бот проанализирует ваше фото
 3. Получите результат с определением формы лица и рекомендациями
 
-*Рекомендации для лучшего результата:*
+<b>Рекомендации для лучшего результата:</b>
 • Используйте фото с хорошим освещением
 • Смотрите прямо в камеру
 • Уберите волосы от лица
 • Держите нейтральное выражение лица
 
-*Команды:*
+<b>Команды:</b>
 /start - Начать работу с ботом
 /help - Показать это сообщение помощи
 /info - Информация о боте
 """
 
 INFO_MESSAGE = """
-📊 *Информация о боте*
+📊 <b>Информация о боте</b>
 
 Этот бот анализирует форму лица на основе технологий компьютерного зрения:
 • Использует MediaPipe для определения 468 ключевых точек лица
@@ -71,7 +144,7 @@ INFO_MESSAGE = """
 """
 
 START_MESSAGE = """
-👋 *Привет! Я бот для анализа формы лица.*
+👋 <b>Привет! Я бот для анализа формы лица.</b>
 
 Я могу определить форму вашего лица и дать рекомендации по прическам, макияжу и аксессуарам, которые подойдут именно вам.
 
@@ -80,6 +153,24 @@ START_MESSAGE = """
 Отправьте /help для получения более подробной информации.
 """
 
+def _static_payload(text: str) -> bytes:
+    """Готовит тело запроса sendMessage без chat_id для статического HTML-сообщения."""
+    # Отрезаем открывающую скобку: chat_id подставляется перед остальными полями в send_static
+    return orjson.dumps({"text": text, "parse_mode": "HTML"})[1:]
+
+# Тела запросов для статических сообщений собираются один раз при загрузке модуля
+START_PAYLOAD = _static_payload(START_MESSAGE)
+HELP_PAYLOAD = _static_payload(HELP_MESSAGE)
+INFO_PAYLOAD = _static_payload(INFO_MESSAGE)
+DEFAULT_TEXT_PAYLOAD = _static_payload("Отправьте фотографию своего лица для анализа.")
+
+# Ответы на команды бота
+COMMAND_PAYLOADS = {
+    "/start": START_PAYLOAD,
+    "/help": HELP_PAYLOAD,
+    "/info": INFO_PAYLOAD,
+}
+
 WAIT_MESSAGE = "⏳ Анализирую вашу фотографию... Пожалуйста, подождите."
 
 ERROR_MESSAGE = """
@@ -96,21 +187,29 @@ ERROR_MESSAGE = """
 
 def send_message(chat_id: Union[int, str], text: str, parse_mode: str = "Markdown") -> Dict[str, Any]:
     """Отправляет текстовое сообщение пользователю."""
-    url = f"{API_URL}/sendMessage"
+    url = _URL_SEND_MESSAGE
     payload = {
         "chat_id": chat_id,
         "text": text,
         "parse_mode": parse_mode
     }
     
-    response = requests.post(url, json=payload)
-    return response.json()
+    response = SESSION.post(url, data=orjson.dumps(payload), headers=JSON_HEADERS, timeout=10)
+    return orjson.loads(response.content)
+
+def send_static(chat_id: Union[int, str], payload: bytes) -> Dict[str, Any]:
+    """Отправляет статическое сообщение по заранее собранному телу запроса (см. _static_payload)."""
+    body = b'{"chat_id":' + orjson.dumps(chat_id) + b"," + payload
+    response = SESSION.post(_URL_SEND_MESSAGE, data=body, headers=JSON_HEADERS, timeout=10)
+    return orjson.loads(response.content)
 
 def send_photo(chat_id: Union[int, str], photo, caption: str = None) -> Dict[str, Any]:
-    """Отправляет фото пользователю."""
-    url = f"{API_URL}/sendPhoto"
+    """Отправляет фото пользователю.
+    
+    photo - путь к файлу, байты изображения (bytes/bytearray) либо URL или file_id.
+    """
+    url = _URL_SEND_PHOTO
     
-    files = None
     data = {"chat_id": chat_id}
     
     if caption:
@@ -119,45 +218,81 @@ def send_photo(chat_id: Union[int, str], photo, caption: str = None) -> Dict[str
     try:
         # Если фото передано как путь к файлу
         if isinstance(photo, str) and os.path.isfile(photo):
-            files = {"photo": open(photo, "rb")}
-            response = requests.post(url, data=data, files=files)
-        # Если фото передано как байты
-        elif isinstance(photo, bytes):
-            photo_io = BytesIO(photo)
-            files = {"photo": ("photo.jpg", photo_io, "image/jpeg")}
-            response = requests.post(url, data=data, files=files)
-        # Если фото передано как BytesIO
-        elif isinstance(photo, BytesIO):
-            photo.seek(0)
+            with open(photo, "rb") as f:
+                response = SESSION.post(url, data=data, files={"photo": f}, timeout=30)
+        # Если фото передано как байты - отдаем их в multipart без промежуточного BytesIO
+        elif isinstance(photo, (bytes, bytearray)):
             files = {"photo": ("photo.jpg", photo, "image/jpeg")}
-            response = requests.post(url, data=data, files=files)
+            response = SESSION.post(url, data=data, files=files, timeout=30)
         # Если это URL или file_id
         else:
             data["photo"] = photo
-            response = requests.post(url, data=data)
+            response = SESSION.post(url, data=data, timeout=10)
         
-        return response.json()
+        return orjson.loads(response.content)
     except Exception as e:
         logger.error(f"Ошибка отправки фото: {str(e)}")
         return {"ok": False, "error": str(e)}
 
 def get_file_path(file_id: str) -> Optional[str]:
     """Получает путь к файлу в Telegram."""
-    url = f"{API_URL}/getFile"
-    response = requests.get(url, params={"file_id": file_id})
-    result = response.json()
+    url = _URL_GET_FILE
+    response = SESSION.get(url, params={"file_id": file_id}, timeout=10)
+    result = orjson.loads(response.content)
     
     if result.get("ok") and "result" in result:
         return result["result"]["file_path"]
     return None
 
-def download_file(file_path: str) -> Optional[bytes]:
-    """Скачивает файл из Telegram."""
-    url = f"https://api.telegram.org/file/bot{TOKEN}/{file_path}"
-    response = requests.get(url)
+def download_file(file_path: str, buf: Optional[bytearray] = None) -> Optional[Union[bytearray, memoryview]]:
+    """
+    Скачивает файл из Telegram.
     
+    Если передан буфер buf и файл в нем помещается, данные записываются в него
+    и возвращается memoryview на заполненную часть. Иначе данные скачиваются
+    в новый bytearray, заранее выделенный по Content-Length.
+    """
+    url = _URL_FILE_BASE + file_path
+    with SESSION.get(url, stream=True, timeout=30) as response:
+        if response.status_code != 200:
+            return None
+        
+        size = int(response.headers.get("Content-Length", 0))
+        target = buf if buf is not None and 0 < size <= len(buf) else bytearray(size)
+        pos = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            end = pos + len(chunk)
+            if target is buf and end > len(buf):
+                # Данных больше, чем помещается в буфер пула - продолжаем в отдельном буфере
+                target = buf[:pos]
+            # Присваивание срезу заполняет буфер, а при несовпадении размера - расширяет его
+            target[pos:end] = chunk
+            pos = end
+        
+        if target is buf:
+            return memoryview(buf)[:pos]
+        # Отрезаем хвост, если данных пришло меньше заявленного
+        del target[pos:]
+        return target
+
+def analyze_photo(photo_data, chat_id: Union[int, str]) -> Optional[Dict[str, Any]]:
+    """
+    Анализирует фотографию и возвращает результат анализа или None при ошибке.
+    
+    В режиме FACE_ANALYZER_MODE=local анализатор вызывается в этом же процессе,
+    иначе байты изображения отправляются в наше основное приложение по HTTP.
+    """
+    if FACE_ANALYZER_MODE == "local":
+        # Импортируем при первом вызове: загрузка MediaPipe нужна только в этом режиме
+        from app import analyze_bytes
+        result = analyze_bytes(photo_data, chat_id)
+        return result if result['success'] else None
+    
+    files = {'image': ('photo.jpg', photo_data, 'image/jpeg')}
+    data = {'telegram_chat_id': str(chat_id)}
+    response = ANALYZER_SESSION.post(FACE_ANALYZER_URL, files=files, data=data, timeout=30)
     if response.status_code == 200:
-        return response.content
+        return orjson.loads(response.content)
     return None
 
 def process_photo(file_id: str, chat_id: Union[int, str]) -> None:
@@ -169,37 +304,28 @@ def process_photo(file_id: str, chat_id: Union[int, str]) -> None:
             send_message(chat_id, "Не удалось получить доступ к фотографии. Пожалуйста, попробуйте другое фото.")
             return
         
-        # Скачиваем файл
-        photo_data = download_file(file_path)
+        # Скачиваем файл в буфер из пула
+        buf = PHOTO_BUFFERS.acquire()
+        photo_data = download_file(file_path, buf)
         if not photo_data:
+            PHOTO_BUFFERS.release(buf)
             send_message(chat_id, "Не удалось скачать фотографию. Пожалуйста, попробуйте другое фото.")
             return
         
         # Предварительно уведомляем пользователя, что начался анализ
         send_message(chat_id, WAIT_MESSAGE)
         
-        # Преобразуем изображение для анализа
-        nparr = np.frombuffer(photo_data, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        # Сохраняем изображение во временный файл
-        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as temp_file:
-            temp_file_path = temp_file.name
-            temp_file.write(photo_data)
-        
-        # Отправляем изображение на анализ в наше основное приложение
-        with open(temp_file_path, 'rb') as f:
-            files = {'image': f}
-            data = {'telegram_chat_id': str(chat_id)}
-            response = requests.post(FACE_ANALYZER_URL, files=files, data=data)
+        # Отправляем байты изображения на анализ
+        result = analyze_photo(photo_data, chat_id)
         
-        # Удаляем временный файл
-        os.unlink(temp_file_path)
+        # Буфер возвращается в пул только после успешного анализа: при исключении на него
+        # могут ссылаться объекты из traceback, поэтому он остается сборщику мусора
+        if isinstance(photo_data, memoryview):
+            photo_data.release()
+        PHOTO_BUFFERS.release(buf)
         
         # Обрабатываем ответ
-        if response.status_code == 200:
-            result = response.json()
-            
+        if result is not None:
             # Результаты обрабатываются в API анализатора лица и отправляются напрямую через Telegram API
             # Так что здесь нам не нужно отправлять ответ пользователю
             # Но на всякий случай проверим, был ли отправлен ответ
@@ -222,60 +348,104 @@ def process_photo(file_id: str, chat_id: Union[int, str]) -> None:
 
 def process_update(update: Dict[str, Any]) -> None:
     """Обрабатывает обновление от Telegram."""
-    # Проверяем, что сообщение содержит текст или фото
-    if 'message' not in update:
+    # Обрабатываем только сообщения из чатов
+    message = update.get('message')
+    if not message:
         return
+    chat = message.get('chat')
+    if not chat:
+        return
+    chat_id = chat['id']
     
-    message = update['message']
-    chat_id = message['chat']['id']
-    
-    # Обрабатываем команды
-    if 'text' in message:
-        if message['text'] == '/start':
-            send_message(chat_id, START_MESSAGE)
-        elif message['text'] == '/help':
-            send_message(chat_id, HELP_MESSAGE)
-        elif message['text'] == '/info':
-            send_message(chat_id, INFO_MESSAGE)
-        else:
-            send_message(chat_id, "Отправьте фотографию своего лица для анализа.")
+    # Обрабатываем команды: любой другой текст получает подсказку отправить фото
+    text = message.get('text')
+    if text is not None:
+        send_static(chat_id, COMMAND_PAYLOADS.get(text, DEFAULT_TEXT_PAYLOAD))
+        return
     
     # Обрабатываем фотографии
-    elif 'photo' in message:
+    photo = message.get('photo')
+    if photo:
         # Берем самую большую версию фото (последний элемент в массиве)
-        file_id = message['photo'][-1]['file_id']
+        file_id = photo[-1]['file_id']
         process_photo(file_id, chat_id)
 
-def get_updates(offset: int = 0) -> List[Dict[str, Any]]:
-    """Получает обновления от Telegram Bot API."""
-    url = f"{API_URL}/getUpdates"
-    params = {
+def _is_actionable(update: Dict[str, Any]) -> bool:
+    """Проверяет, что обновление - сообщение с текстом или фото, на которое бот отвечает."""
+    message = update.get('message')
+    return bool(message) and ('text' in message or 'photo' in message)
+
+def _process_update_safe(update: Dict[str, Any]) -> None:
+    """Обрабатывает обновление в потоке пула, записывая ошибки в лог."""
+    try:
+        process_update(update)
+    except Exception as e:
+        logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {str(e)}")
+
+class RetryAfter(Exception):
+    """Telegram ограничил частоту запросов (ошибка 429) и просит повторить через retry_after секунд."""
+    
+    def __init__(self, retry_after: int):
+        super().__init__(f"Повторите запрос через {retry_after} с")
+        self.retry_after = retry_after
+
+def _backoff_delay(attempt: int) -> float:
+    """Экспоненциальная пауза с небольшим случайным разбросом: 0.5, 1, 2, ... но не более 30 секунд."""
+    return min(30.0, 0.5 * 2 ** attempt) + random.uniform(0, 0.25)
+
+def _request_updates(body: bytes, timeout: int) -> bytes:
+    """Выполняет запрос getUpdates и возвращает тело ответа."""
+    # Таймаут сокета больше таймаута long polling
+    if _POLL_VIA_SESSION:
+        return SESSION.post(_URL_GET_UPDATES, data=body, headers=JSON_HEADERS, timeout=timeout + 10).content
+    
+    _POLL_CONN.timeout = timeout + 10
+    if _POLL_CONN.sock is not None:
+        _POLL_CONN.sock.settimeout(_POLL_CONN.timeout)
+    _POLL_CONN.request("POST", _PATH_GET_UPDATES, body=body, headers=JSON_HEADERS)
+    return _POLL_CONN.getresponse().read()
+
+def get_updates(offset: int = 0, timeout: int = 50) -> Optional[List[Dict[str, Any]]]:
+    """
+    Получает обновления от Telegram Bot API (long polling с таймаутом timeout секунд).
+    
+    Возвращает None при ошибке и выбрасывает RetryAfter, если Telegram ограничил частоту запросов.
+    Вызывается только из потока опроса: соединение _POLL_CONN не потокобезопасно.
+    """
+    body = orjson.dumps({
         "offset": offset,
-        "timeout": 10  # Уменьшаем таймаут для более частых проверок
-    }
+        "timeout": timeout,
+        # Telegram отфильтрует на своей стороне все, кроме сообщений
+        "allowed_updates": ALLOWED_UPDATES
+    })
     
     try:
-        response = requests.get(url, params=params, timeout=15)  # Добавляем таймаут для запроса
-        result = response.json()
-        if result.get("ok") and "result" in result:
-            return result["result"]
-        elif not result.get("ok"):
-            logger.error(f"API вернул ошибку: {result.get('description', 'Неизвестная ошибка')}")
-    except requests.exceptions.RequestException as e:
+        result = orjson.loads(_request_updates(body, timeout))
+    except (OSError, http.client.HTTPException) as e:
+        # Закрываем соединение: при следующем запросе http.client откроет новое
+        _POLL_CONN.close()
         logger.error(f"Ошибка сети при получении обновлений: {str(e)}")
+        return None
     except Exception as e:
+        _POLL_CONN.close()
         logger.error(f"Неожиданная ошибка при получении обновлений: {str(e)}")
+        return None
     
-    return []
+    if result.get("ok") and "result" in result:
+        return result["result"]
+    if result.get("error_code") == 429:
+        raise RetryAfter(result.get("parameters", {}).get("retry_after", 1))
+    logger.error(f"API вернул ошибку: {result.get('description', 'Неизвестная ошибка')}")
+    return None
 
 def set_webhook(webhook_url: str) -> bool:
     """Устанавливает вебхук для бота."""
-    url = f"{API_URL}/setWebhook"
+    url = _URL_SET_WEBHOOK
     params = {"url": webhook_url}
     
     try:
-        response = requests.get(url, params=params)
-        result = response.json()
+        response = SESSION.get(url, params=params)
+        result = orjson.loads(response.content)
         if result.get("ok", False):
             logger.info(f"Вебхук успешно установлен: {webhook_url}")
             return True
@@ -286,13 +456,23 @@ def set_webhook(webhook_url: str) -> bool:
     
     return False
 
-def polling_loop() -> None:
-    """Запускает цикл опроса обновлений от Telegram."""
+@functools.lru_cache(maxsize=1)
+def _bot_info() -> Dict[str, Any]:
+    """Возвращает ответ getMe; данные бота не меняются за время работы процесса."""
+    return orjson.loads(SESSION.get(_URL_GET_ME, timeout=10).content)
+
+def polling_loop(poll_timeout: int = 50) -> None:
+    """
+    Запускает цикл опроса обновлений от Telegram.
+    
+    Args:
+        poll_timeout: Таймаут long polling для getUpdates в секундах
+    """
     logger.info("Запущен цикл опроса обновлений")
     
     # Проверяем соединение с Telegram API
     try:
-        bot_info = requests.get(f"{API_URL}/getMe", timeout=10).json()
+        bot_info = _bot_info()
         if bot_info.get("ok", False):
             bot_username = bot_info["result"]["username"]
             logger.info(f"Успешное соединение с API. Бот @{bot_username} активен")
@@ -303,50 +483,51 @@ def polling_loop() -> None:
     
     offset = 0
     consecutive_errors = 0
-    max_consecutive_errors = 5
     
     while True:
         try:
             # Получаем обновления
-            updates = get_updates(offset)
+            updates = get_updates(offset, poll_timeout)
+            
+            # При ошибке повторяем запрос с экспоненциально растущей паузой
+            if updates is None:
+                delay = _backoff_delay(consecutive_errors)
+                consecutive_errors += 1
+                logger.warning(f"Повтор запроса обновлений через {delay:.1f} с (ошибок подряд: {consecutive_errors})")
+                time.sleep(delay)
+                continue
             
             # Если успешно получили обновления, сбрасываем счетчик ошибок
-            if updates is not None:
-                consecutive_errors = 0
+            consecutive_errors = 0
             
-            # Обрабатываем каждое обновление
+            # Сразу сдвигаем смещение и передаем обновление в пул потоков, не дожидаясь обработки;
+            # обновления без текста и фото в пул не передаются
             for update in updates:
-                try:
-                    process_update(update)
-                    # Увеличиваем смещение для следующего запроса
-                    offset = update['update_id'] + 1
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {str(e)}")
-            
-            # Небольшая пауза между запросами
-            time.sleep(0.5)
+                offset = update['update_id'] + 1
+                if _is_actionable(update):
+                    EXECUTOR.submit(_process_update_safe, update)
             
         except KeyboardInterrupt:
             logger.info("Бот остановлен вручную")
+            # Дожидаемся обработки уже полученных обновлений
+            EXECUTOR.shutdown(wait=True)
             break
+        
+        except RetryAfter as e:
+            # Telegram сам сообщает, сколько нужно подождать
+            logger.warning(f"Превышен лимит запросов к Telegram API. Пауза на {e.retry_after} с...")
+            time.sleep(e.retry_after)
             
         except Exception as e:
-            # Увеличиваем счетчик последовательных ошибок
+            delay = _backoff_delay(consecutive_errors)
             consecutive_errors += 1
-            logger.error(f"Ошибка в цикле опроса ({consecutive_errors}/{max_consecutive_errors}): {str(e)}")
-            
-            # Если слишком много ошибок подряд, делаем более длительную паузу
-            if consecutive_errors >= max_consecutive_errors:
-                logger.warning(f"Слишком много ошибок подряд. Пауза на 30 секунд...")
-                time.sleep(30)
-                consecutive_errors = 0
-            else:
-                # Короткая пауза перед повторной попыткой
-                time.sleep(5)
+            logger.error(f"Ошибка в цикле опроса (ошибок подряд: {consecutive_errors}): {str(e)}. "
+                         f"Пауза {delay:.1f} с")
+            time.sleep(delay)
 
 if __name__ == "__main__":
     # Выводим информацию о запуске бота
-    bot_info = requests.get(f"{API_URL}/getMe").json()
+    bot_info = _bot_info()
     if bot_info.get("ok", False):
         bot_username = bot_info["result"]["username"]
         logger.info(f"Бот @{bot_username} запущен")
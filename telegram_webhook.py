@@ -2,10 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import os
+import queue
+import threading
 import flask
 import logging
 import requests
-import json
+import orjson
 from telegram_bot import process_update
 
 # Настройка логирования
@@ -15,21 +17,45 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Размер очереди обновлений и число потоков-обработчиков
+WORK_QUEUE_SIZE = 1024
+WORKER_THREADS = 8
+
+def _worker(work_q: queue.Queue) -> None:
+    """Обрабатывает обновления из очереди в фоновом потоке."""
+    while True:
+        update = work_q.get()
+        try:
+            process_update(update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {str(e)}")
+        finally:
+            work_q.task_done()
+
 def create_app():
     """Создает Flask приложение для обработки вебхуков."""
     app = flask.Flask(__name__)
     
+    # Обновления обрабатываются пулом потоков, а вебхук сразу подтверждает получение:
+    # Telegram не ждет медленный анализ фото и не повторяет запрос по таймауту
+    work_q = queue.Queue(maxsize=WORK_QUEUE_SIZE)
+    for i in range(WORKER_THREADS):
+        threading.Thread(target=_worker, args=(work_q,), name=f"webhook-worker-{i}", daemon=True).start()
+    
     @app.route('/webhook', methods=['POST'])
     def webhook():
-        """Обрабатывает входящие вебхуки от Telegram."""
+        """Принимает вебхук от Telegram и ставит обновление в очередь обработки."""
         try:
-            update = flask.request.json
-            logger.info(f"Получено обновление: {update.get('update_id')}")
+            update = orjson.loads(flask.request.get_data())
+            logger.debug("Получено обновление: %s", update.get('update_id'))
             
-            # Обрабатываем обновление
-            process_update(update)
+            # Ставим обновление в очередь; при переполнении Telegram повторит доставку позже
+            work_q.put_nowait(update)
             
-            return {'status': 'success'}, 200
+            return '', 204
+        except queue.Full:
+            logger.warning("Очередь обновлений переполнена")
+            return {'status': 'error', 'message': 'Queue is full'}, 503
         except Exception as e:
             logger.error(f"Ошибка при обработке вебхука: {str(e)}")
             return {'status': 'error', 'message': str(e)}, 500
@@ -42,6 +68,8 @@ def create_app():
     return app
 
 if __name__ == "__main__":
+    # Для локального запуска; в продакшене:
+    # gunicorn -w 4 --worker-class gthread --threads 8 "telegram_webhook:create_app()"
     app = create_app()
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
\ No newline at end of file
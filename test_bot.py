@@ -23,7 +23,7 @@ if not TOKEN:
 API_URL = f"https://api.telegram.org/bot{TOKEN}"
 
 def test_bot_api():
-    """Тестирует подключение к Telegram Bot API."""
+    """Тестирует подключение к Telegram Bot API. Возвращает ответ getMe или None при ошибке."""
     try:
         logger.info("Проверка соединения с Telegram Bot API...")
         response = requests.get(f"{API_URL}/getMe", timeout=10)
@@ -54,23 +54,27 @@ def test_bot_api():
             else:
                 logger.error(f"❌ Ошибка при получении информации о вебхуке: {webhook_info.get('description', 'Неизвестная ошибка')}")
             
-            return True
+            return result
         else:
             logger.error(f"❌ Ошибка API: {result.get('description', 'Неизвестная ошибка')}")
-            return False
+            return None
             
     except requests.exceptions.RequestException as e:
         logger.error(f"❌ Ошибка сети при подключении к API: {str(e)}")
-        return False
+        return None
     except Exception as e:
         logger.error(f"❌ Неожиданная ошибка: {str(e)}")
-        return False
+        return None
 
-def send_test_message():
-    """Отправляет тестовое сообщение самому себе (боту)."""
+def send_test_message(bot_info=None):
+    """Отправляет тестовое сообщение самому себе (боту).
+    
+    bot_info - ответ getMe из test_bot_api(); если не передан, запрашивается заново.
+    """
     try:
         # Получаем ID бота
-        bot_info = requests.get(f"{API_URL}/getMe", timeout=10).json()
+        if bot_info is None:
+            bot_info = requests.get(f"{API_URL}/getMe", timeout=10).json()
         if not bot_info.get("ok", False):
             logger.error("❌ Не удалось получить информацию о боте")
             return False
@@ -107,9 +111,10 @@ def send_test_message():
 if __name__ == "__main__":
     logger.info("Начало тестирования Telegram бота")
     
-    if test_bot_api():
+    bot_info = test_bot_api()
+    if bot_info:
         logger.info("✅ Тест API прошел успешно")
-        send_test_message()
+        send_test_message(bot_info)
     else:
         logger.error("❌ Тест API не пройден. Проверьте токен и соединение")
     
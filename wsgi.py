@@ -0,0 +1,12 @@
+import logging
+
+# Configure logging here: gunicorn does not set up the application's root logger
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+from app import app
+
+# WSGI entry point for production servers:
+# gunicorn --workers 4 --threads 4 --worker-class gthread --timeout 30 wsgi:app